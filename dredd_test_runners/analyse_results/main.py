@@ -1,55 +1,49 @@
 import argparse
-import json
 import sys
 
+from dredd_test_runners.common.kill_database import KILL_DATABASE_FILENAME, open_kill_database
+
 from pathlib import Path
-from typing import Dict
 
 
 def main():
     parser = argparse.ArgumentParser()
     parser.add_argument("work_dir",
-                        help="Directory containing test results. It should have subdirectories, 'tests' and 'killed_mutants'.",
+                        help=f"Directory containing test results. It should contain a kill database, "
+                             f"'{KILL_DATABASE_FILENAME}'.",
                         type=Path)
     args = parser.parse_args()
     work_dir: Path = args.work_dir
     if not work_dir.exists() or not work_dir.is_dir():
         print(f"Error: {str(work_dir)} is not a working directory.")
         sys.exit(1)
-    tests_dir = work_dir / "tests"
-    if not tests_dir.exists() or not tests_dir.is_dir():
-        print(f"Error: {str(tests_dir)} does not exist.")
-        sys.exit(1)
-    killed_mutants_dir = work_dir / "killed_mutants"
-    if not killed_mutants_dir.exists() or not killed_mutants_dir.is_dir():
-        print(f"Error: {str(killed_mutants_dir)} does not exist.")
+    kill_database_file = work_dir / KILL_DATABASE_FILENAME
+    if not kill_database_file.exists():
+        print(f"Error: {str(kill_database_file)} does not exist. Results in the format used by earlier versions of the "
+              f"runners can be imported using import-kill-database.")
         sys.exit(1)
 
-    for test in tests_dir.glob('*'):
-        if not test.is_dir():
-            continue
-        if not test.name.startswith("csmith"):
-            continue
-        kill_summary: Path = test / "kill_summary.json"
-        if not kill_summary.exists():
-            continue
-        kill_summary_json: Dict = json.load(open(kill_summary, 'r'))
-        for mutant in kill_summary_json["killed_mutants"]:
-            mutant_summary = json.load(open(killed_mutants_dir / str(mutant) / "kill_info.json", 'r'))
-            kill_type: str = mutant_summary['kill_type']
-            if kill_type == 'KillStatus.KILL_DIFFERENT_STDOUT':
-                print(mutant_summary)
-            elif kill_type == 'KillStatus.KILL_RUNTIME_TIMEOUT':
-                print(mutant_summary)
-            elif kill_type == 'KillStatus.KILL_DIFFERENT_EXIT_CODES':
-                print(mutant_summary)
-            elif kill_type == 'KillStatus.KILL_COMPILER_CRASH':
-                pass
-            elif kill_type == 'KillStatus.KILL_COMPILER_TIMEOUT':
-                pass
-            else:
-                print(kill_type)
-                assert(False)
+    with open_kill_database(work_dir) as kill_database:
+        kills = kill_database.get_kills_by_tests(test_name_prefix="csmith")
+    for _, _, mutant_summary in kills:
+        kill_type: str = mutant_summary['kill_type']
+        if kill_type == 'KillStatus.KILL_DIFFERENT_STDOUT':
+            print(mutant_summary)
+        elif kill_type == 'KillStatus.KILL_RUNTIME_TIMEOUT':
+            print(mutant_summary)
+        elif kill_type == 'KillStatus.KILL_DIFFERENT_EXIT_CODES':
+            print(mutant_summary)
+        elif kill_type == 'KillStatus.KILL_RUNTIME_OUT_OF_MEMORY':
+            print(mutant_summary)
+        elif kill_type == 'KillStatus.KILL_COMPILER_CRASH':
+            pass
+        elif kill_type == 'KillStatus.KILL_COMPILER_TIMEOUT':
+            pass
+        elif kill_type == 'KillStatus.KILL_COMPILER_OUT_OF_MEMORY':
+            pass
+        else:
+            print(kill_type)
+            assert(False)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,17 @@
+import argparse
+
+
+# Argument types for command-line options whose values must be in range, so that bad values are rejected when arguments
+# are parsed.
+def positive_int(value: str) -> int:
+    result: int = int(value)
+    if result < 1:
+        raise argparse.ArgumentTypeError(f"must be at least 1, got {result}")
+    return result
+
+
+def non_negative_int(value: str) -> int:
+    result: int = int(value)
+    if result < 0:
+        raise argparse.ArgumentTypeError(f"must not be negative, got {result}")
+    return result
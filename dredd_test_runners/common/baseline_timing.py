@@ -0,0 +1,45 @@
+import resource
+import statistics
+import time
+
+from typing import Callable, List, TypeVar
+
+T = TypeVar('T')
+
+
+def _children_cpu_time() -> float:
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return usage.ru_utime + usage.ru_stime
+
+
+class BaselineTiming:
+    # Estimates the time taken to compile, or to run, a test without mutants, on which mutant time limits are based.
+    # A single measurement can be thrown off by a disturbance such as a cold file cache or a burst of load from other
+    # workers, so several are taken, reusing the runs that are needed anyway (e.g. the mutant tracking compilation
+    # alongside the regular compilation) where possible, and their median is used. Samples reused in this way come from
+    # similar but not identical steps (e.g. the mutant tracking compiler is instrumented), so with few samples the
+    # estimate is only an approximation of the time taken by any one of them.
+    #
+    # If 'cpu_time' is set, the CPU time used by the processes that each measured step runs is measured, rather than
+    # the wall-clock time the step takes. This relies on those processes having been waited for by the time the step
+    # finishes, as run_process_with_timeout ensures.
+    def __init__(self, cpu_time: bool):
+        self._cpu_time: bool = cpu_time
+        self.samples: List[float] = []
+
+    # Runs 'step', recording the time it takes, and returns its result.
+    def measure(self, step: Callable[[], T]) -> T:
+        wall_clock_time_start: float = time.time()
+        cpu_time_start: float = _children_cpu_time()
+        result: T = step()
+        self.samples.append(_children_cpu_time() - cpu_time_start if self._cpu_time
+                            else time.time() - wall_clock_time_start)
+        return result
+
+    def estimate(self) -> float:
+        return statistics.median(self.samples)
+
+    def __str__(self) -> str:
+        plural: str = '' if len(self.samples) == 1 else 's'
+        return f"{self.estimate():.3f}s (median of {len(self.samples)} sample{plural}, from {min(self.samples):.3f}s " \
+               f"to {max(self.samples):.3f}s)"
@@ -2,5 +2,15 @@ MIN_TIMEOUT_FOR_MUTANT_COMPILATION: float = 1.0
 TIMEOUT_MULTIPLIER_FOR_MUTANT_COMPILATION: float = 5.0
 MIN_TIMEOUT_FOR_MUTANT_EXECUTION: float = 1.0
 TIMEOUT_MULTIPLIER_FOR_MUTANT_EXECUTION: float = 5.0
+# The test runners base mutant timeouts on baseline times estimated from several samples, so they can use lower minimum
+# timeouts than the interestingness tests of reductions, which must not become flaky under load.
+MIN_RUNNER_TIMEOUT_FOR_MUTANT_COMPILATION: float = 0.5
+MIN_RUNNER_TIMEOUT_FOR_MUTANT_EXECUTION: float = 0.5
+# The number of times a test is run without mutants to estimate its run time, on which mutant execution timeouts are
+# based.
+BASELINE_EXECUTION_SAMPLES: int = 3
+# When time limits are imposed on CPU time, wall-clock time is limited to this multiple of the CPU time limit, so that
+# processes that are blocked rather than running are still stopped.
+WALL_CLOCK_TIMEOUT_MULTIPLIER_FOR_CPU_TIME_LIMITS: float = 10.0
 DEFAULT_COMPILATION_TIMEOUT: int = 5
 DEFAULT_RUNTIME_TIMEOUT: int = 10
@@ -0,0 +1,78 @@
+import argparse
+import os
+import shlex
+
+from dredd_test_runners.common.run_process_with_timeout import ProcessResult, run_process_with_timeout
+
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+
+def add_direct_cc1_argument(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument("--direct_cc1",
+                        action="store_true",
+                        help="For each compiler command used to build mutants of a test, ask the clang driver once "
+                             "(using -###) which jobs it would run, and then run those jobs (e.g. 'clang -cc1' and the "
+                             "linker) directly for each mutant, saving the cost of starting the driver. Coverage is "
+                             "tracked in the same way, so mutants in the driver itself are neither exercised nor "
+                             "counted as covered in this mode.")
+
+
+def resolve_driver_jobs(cmd: List[str], temp_dir: Path, timeout_seconds: float) -> Optional[List[List[str]]]:
+    # Returns the jobs that the clang driver would run for the given command, or None if they could not be determined.
+    # Any temporary files the jobs use are placed in 'temp_dir'. The driver prints each job on its own line, as a
+    # sequence of double-quoted arguments, preceded by a space.
+    resolve_environment = os.environ.copy()
+    resolve_environment["TMPDIR"] = str(temp_dir)
+    result: Optional[ProcessResult] = run_process_with_timeout(cmd=cmd + ['-###'],
+                                                               timeout_seconds=timeout_seconds,
+                                                               env=resolve_environment)
+    if result is None or result.returncode != 0:
+        return None
+    jobs: List[List[str]] = [shlex.split(line) for line in result.stderr.decode('utf-8').splitlines()
+                             if line.startswith(' "')]
+    return jobs if jobs else None
+
+
+class DriverJobCache:
+    # Runs compiler commands by running the jobs that the compiler driver would run for them, determining these once
+    # per distinct command. The jobs are determined without any mutants enabled, and are then run with whatever
+    # environment the command is run with (e.g. with DREDD_ENABLED_MUTATION set). Commands whose jobs cannot be
+    # determined, e.g. because the compiler is not clang, are run as they are.
+    #
+    # Temporary files used by the jobs of a command have the same names every time the command is run, so a cache must
+    # not be shared by processes that might run the same command concurrently.
+    def __init__(self, temp_dir: Path):
+        self._temp_dir: Path = temp_dir
+        self._jobs: Dict[Tuple[str, ...], Optional[List[List[str]]]] = {}
+
+    # Behaves like run_process_with_timeout, with the time and memory limits applying to each job separately. Returns
+    # the result of the first job that failed, or of the last job if all succeeded, accounting for the resources used by
+    # all jobs that were run.
+    def run(self,
+            cmd: List[str],
+            timeout_seconds: float,
+            env: Optional[Dict[str, str]] = None,
+            cpu_time_limit_seconds: Optional[float] = None,
+            memory_limit_bytes: Optional[int] = None) -> Optional[ProcessResult]:
+        key: Tuple[str, ...] = tuple(cmd)
+        if key not in self._jobs:
+            self._jobs[key] = resolve_driver_jobs(cmd, self._temp_dir, timeout_seconds)
+        jobs: Optional[List[List[str]]] = self._jobs[key]
+        if jobs is None:
+            return run_process_with_timeout(cmd=cmd, timeout_seconds=timeout_seconds, env=env,
+                                            cpu_time_limit_seconds=cpu_time_limit_seconds,
+                                            memory_limit_bytes=memory_limit_bytes)
+        result: Optional[ProcessResult] = None
+        for job in jobs:
+            previous_result: Optional[ProcessResult] = result
+            result = run_process_with_timeout(cmd=job, timeout_seconds=timeout_seconds, env=env,
+                                              cpu_time_limit_seconds=cpu_time_limit_seconds,
+                                              memory_limit_bytes=memory_limit_bytes)
+            if result is None:
+                return None
+            if previous_result is not None:
+                result.add_resource_usage(previous_result)
+            if result.returncode != 0:
+                return result
+        return result
@@ -0,0 +1,833 @@
+import argparse
+import asyncio
+import ctypes
+import multiprocessing
+import os
+import queue
+import random
+import re
+import shlex
+import shutil
+import tempfile
+import time
+
+from dredd_test_runners.common.argument_types import non_negative_int, positive_int
+from dredd_test_runners.common.baseline_timing import BaselineTiming
+from dredd_test_runners.common.constants import BASELINE_EXECUTION_SAMPLES
+from dredd_test_runners.common.driver_jobs import DriverJobCache
+from dredd_test_runners.common.kill_database import (KillDatabase, lease_holder_id, MUTANT_LEASE_GRACE_PERIOD,
+                                                     open_kill_database)
+from dredd_test_runners.common.killed_mutants import KilledMutants
+from dredd_test_runners.common.mutant_group_testing import (is_survived, max_runs_to_test_mutant_group,
+                                                            run_test_with_mutant_groups)
+from dredd_test_runners.common.mutation_tree import MutationTree
+from dredd_test_runners.common.preprocessed_sources import PreprocessedSources
+from dredd_test_runners.common.run_process_with_timeout import (ProcessResult, run_process_with_timeout,
+                                                                 run_process_with_timeout_async)
+from dredd_test_runners.common.run_test_with_mutants import (BINARY_HASH_FUNCTIONS, memory_limit_bytes,
+                                                             mutant_test_time_limit, MutantExecutionCache,
+                                                             run_test_with_mutants, KillStatus, TimeoutStatistics)
+from dredd_test_runners.common.two_stage_build import TwoStageBuild
+from dredd_test_runners.common.worker_pool import run_worker_pool
+
+from pathlib import Path
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+# The compiler flags with which programs are compiled unless other configurations are given.
+DEFAULT_COMPILER_CONFIGURATION: List[str] = ["-O3"]
+
+# The file in a test's directory under work/tests that records the flags of the compiler configuration in which the test
+# was evaluated, so that its kills can be reproduced, e.g. when reducing it.
+COMPILER_FLAGS_FILENAME: str = "compiler_flags.txt"
+
+
+# Returns the compiler configuration's flags recorded for a test. Tests recorded before the flags were saved were all
+# compiled with the default configuration.
+def read_test_compiler_flags(test_dir: Path) -> List[str]:
+    compiler_flags_path: Path = test_dir / COMPILER_FLAGS_FILENAME
+    if not compiler_flags_path.exists():
+        return list(DEFAULT_COMPILER_CONFIGURATION)
+    return shlex.split(compiler_flags_path.read_text())
+
+
+class GeneratedProgram:
+    def __init__(self, name: str, compiler_args: List, files_to_save: Dict[str, Path]):
+        # A name for the test, unique to the generator seed that was used, e.g. 'csmith_1234'.
+        self.name: str = name
+        # Arguments with which to invoke a compiler on the program, not including the output file or the flags of the
+        # compiler configuration (such as the optimization level) in which the program is being compiled.
+        self.compiler_args: List = compiler_args
+        # The files that make up the program, keyed by the names they should be given when saved as a test.
+        self.files_to_save: Dict[str, Path] = files_to_save
+
+
+class VettedConfiguration:
+    # A configuration of compiler flags in which a generated program compiles and runs successfully without mutants, and
+    # for which mutant coverage has been tracked: everything needed to evaluate mutants against the program in this
+    # configuration.
+    def __init__(self,
+                 test_name: str,
+                 compiler_flags: List[str],
+                 compiler_args: List,
+                 configuration_dir: Path,
+                 compile_timing: BaselineTiming,
+                 original_sources_compile_timing: Optional[BaselineTiming],
+                 run_timing: BaselineTiming,
+                 regular_hash: str,
+                 regular_execution_result: ProcessResult,
+                 two_stage_build: Optional[TwoStageBuild],
+                 preprocessed_sources: Optional[PreprocessedSources]):
+        # The name under which the program is recorded as a test in this configuration.
+        self.test_name: str = test_name
+        # The configuration's flags, e.g. ['-O3'].
+        self.compiler_flags: List[str] = compiler_flags
+        # The configuration's flags followed by the program's compiler arguments.
+        self.compiler_args: List = compiler_args
+        # A subdirectory of the program's directory in which the executables and other files built in this
+        # configuration are placed.
+        self.configuration_dir: Path = configuration_dir
+        self.compile_timing: BaselineTiming = compile_timing
+        # If the program was preprocessed, the timing of compiling its original sources.
+        self.original_sources_compile_timing: Optional[BaselineTiming] = original_sources_compile_timing
+        self.run_timing: BaselineTiming = run_timing
+        self.regular_hash: str = regular_hash
+        self.regular_execution_result: ProcessResult = regular_execution_result
+        # Sorted, without duplicates. Empty until coverage has been tracked.
+        self.covered_mutants: List[int] = []
+        # How mutants are built in two stages, with the unmutated build's object files in 'configuration_dir', or None
+        # if mutants are compiled and linked in one go.
+        self.two_stage_build: Optional[TwoStageBuild] = two_stage_build
+        # The program's preprocessed sources, in 'configuration_dir', from which mutants are compiled, or None if
+        # mutants are compiled from the original sources.
+        self.preprocessed_sources: Optional[PreprocessedSources] = preprocessed_sources
+
+    # Estimated wall-clock times (see BaselineTiming), or CPU times if mutants' time limits are imposed on CPU time.
+    @property
+    def compile_time(self) -> float:
+        if self.original_sources_compile_timing is None:
+            return self.compile_timing.estimate()
+        # Mutant compilation timeouts are based on the slower compilation, as a mutant may be compiled either way.
+        return max(self.compile_timing.estimate(), self.original_sources_compile_timing.estimate())
+
+    @property
+    def run_time(self) -> float:
+        return self.run_timing.estimate()
+
+    # The mutant tracking compilation is timed as a further sample of the compile time. It compiles the original
+    # sources, so if the program was preprocessed it is a sample of the time taken to compile those.
+    @property
+    def tracking_compile_timing(self) -> BaselineTiming:
+        return self.compile_timing if self.original_sources_compile_timing is None\
+            else self.original_sources_compile_timing
+
+
+class VettedProgram:
+    # A generated program that is free from sanitizer errors, together with each configuration of compiler flags in
+    # which it has been vetted.
+    def __init__(self,
+                 generated_program: GeneratedProgram,
+                 program_dir: Path,
+                 configurations: List[VettedConfiguration]):
+        self.generated_program: GeneratedProgram = generated_program
+        # A temporary directory, owned by this program, in which its files and executables are placed.
+        self.program_dir: Path = program_dir
+        self.configurations: List[VettedConfiguration] = configurations
+
+
+class VettingStatistics:
+    # Counts, across all workers, the programs whose sanitizer checks were skipped because they covered no unkilled
+    # mutants. As with KilledMutants, the count is held in shared memory, so it must be created before workers are
+    # forked.
+    def __init__(self):
+        self._sanitizer_checks_avoided = multiprocessing.Value(ctypes.c_long, 0)
+
+    # Returns the number of programs whose sanitizer checks have been skipped, including this one.
+    def note_sanitizer_checks_avoided(self) -> int:
+        with self._sanitizer_checks_avoided.get_lock():
+            self._sanitizer_checks_avoided.value += 1
+            return self._sanitizer_checks_avoided.value
+
+    @property
+    def sanitizer_checks_avoided(self) -> int:
+        return self._sanitizer_checks_avoided.value
+
+
+# A program generator is given the command line arguments and a temporary directory in which to place the program.
+ProgramGenerator = Callable[[argparse.Namespace, Path], Optional[GeneratedProgram]]
+
+# Time in seconds for which pipeline workers block on the queue of vetted programs before checking whether testing
+# should continue.
+QUEUE_POLL_INTERVAL: float = 1.0
+
+
+def still_testing(start_time_for_overall_testing: float,
+                  time_of_last_kill: float,
+                  total_test_time: int,
+                  maximum_time_since_last_kill: int) -> bool:
+    if 0 < total_test_time < int(time.time() - start_time_for_overall_testing):
+        return False
+    if 0 < maximum_time_since_last_kill < int(time.time() - time_of_last_kill):
+        return False
+    return True
+
+
+def add_worker_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument("--jobs",
+                        default=1,
+                        help="Number of worker processes to use. The workers share the mutation trees and the set of "
+                             "killed mutants. If --vetting_jobs is non-zero, this is the number of workers that "
+                             "evaluate mutants.",
+                        type=positive_int)
+    parser.add_argument("--vetting_jobs",
+                        default=0,
+                        help="Number of worker processes dedicated to generating and vetting programs (compiling and "
+                             "running them without mutants and with sanitizers, and tracking the mutants they cover). "
+                             "Vetted programs are queued for the --jobs workers, which then only evaluate mutants. If "
+                             "0, each worker vets the programs it evaluates.",
+                        type=non_negative_int)
+    parser.add_argument("--vetted_queue_size",
+                        default=None,
+                        help="Maximum number of vetted programs that may be waiting for evaluation when "
+                             "--vetting_jobs is non-zero. Defaults to the value of --jobs.",
+                        type=positive_int)
+
+
+def add_track_coverage_first_argument(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument("--track_coverage_first",
+                        action="store_true",
+                        help="When vetting a program, track the mutants it covers before checking it with sanitizers, "
+                             "and discard it without the (expensive) sanitizer checks if it covers no mutants that "
+                             "have not been killed. Such programs are then not recorded as tests, so the mutants they "
+                             "cover are not recorded either.")
+
+
+# Turns a configuration's flags into a suffix for the names of tests compiled with them, e.g. 'O3_march_native'.
+def _configuration_suffix(flags: List[str]) -> str:
+    return re.sub(r'[^A-Za-z0-9]+', '_', ' '.join(flags)).strip('_')
+
+
+class _AppendCompilerConfiguration(argparse.Action):
+    # Adds a configuration of compiler flags each time the argument occurs, replacing the default on its first
+    # occurrence. Configurations that would give tests the same name are rejected.
+    def __call__(self, parser: argparse.ArgumentParser, namespace: argparse.Namespace, values: str,
+                 option_string: Optional[str] = None) -> None:
+        configurations: List[List[str]] = getattr(namespace, self.dest)
+        configurations = [] if configurations is self.default else list(configurations)
+        flags: List[str] = shlex.split(values)
+        if any(_configuration_suffix(flags) == _configuration_suffix(other) for other in configurations):
+            parser.error(f"compiler configuration '{values}' gives tests the same name as an earlier configuration")
+        configurations.append(flags)
+        setattr(namespace, self.dest, configurations)
+
+
+def add_compiler_configurations_argument(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument("--compiler_configuration",
+                        dest="compiler_configurations",
+                        metavar="FLAGS",
+                        default=[DEFAULT_COMPILER_CONFIGURATION],
+                        action=_AppendCompilerConfiguration,
+                        help="A configuration of compiler flags in which to evaluate mutants against each vetted "
+                             "program. May be given several times, once per configuration, e.g. "
+                             "--compiler_configuration=-O1 --compiler_configuration='-O3 -march=native'. A program is "
+                             "generated and checked with sanitizers once, and is then vetted, tracked for mutant "
+                             "coverage and recorded as a separate test (named after the program and the flags) in "
+                             "each configuration. Default is a single configuration, -O3, for which tests are named "
+                             "after the program alone.")
+
+
+def add_concurrent_sanitizer_checks_argument(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument("--concurrent_sanitizer_checks",
+                        action="store_true",
+                        help="When vetting a program, compile and run it with the different sanitizers concurrently, "
+                             "stopping the remaining checks as soon as one fails, so that a program is accepted or "
+                             "rejected sooner. Each vetting worker then runs several processes at once.")
+
+
+def run_generated_program_tests(args: argparse.Namespace,
+                                generate_program: ProgramGenerator,
+                                mutation_tree: MutationTree,
+                                start_time_for_overall_testing: float) -> None:
+    # Make a work directory in which information about the mutant killing process will be stored. If this already
+    # exists that's OK - there may be other processes working on mutant killing, or we may be continuing a job that
+    # crashed previously.
+    Path("work").mkdir(exist_ok=True)
+    Path("work/tests").mkdir(exist_ok=True)
+    # Create the kill database, if it does not exist, before any workers start. Each worker opens its own connection.
+    open_kill_database(Path("work")).close()
+
+    killed_mutants: KilledMutants = KilledMutants(mutation_tree.num_mutations)
+    vetting_statistics: VettingStatistics = VettingStatistics()
+
+    # Each program gets its own directory under this one. Vetted programs may be queued when a worker finishes, so this
+    # is owned by the parent process, which removes it once all workers have finished.
+    with tempfile.TemporaryDirectory() as temp_dir_for_generated_code:
+        if args.vetting_jobs == 0:
+            run_worker_pool(num_workers=args.jobs,
+                            target=_vetting_and_evaluation_worker,
+                            target_args=(args, mutation_tree, generate_program, killed_mutants, vetting_statistics,
+                                         start_time_for_overall_testing, Path(temp_dir_for_generated_code)))
+        else:
+            vetted_programs: multiprocessing.Queue = multiprocessing.get_context('fork').Queue(
+                maxsize=args.jobs if args.vetted_queue_size is None else args.vetted_queue_size)
+            run_worker_pool(num_workers=args.vetting_jobs + args.jobs,
+                            target=_pipeline_worker,
+                            target_args=(args, mutation_tree, generate_program, killed_mutants, vetting_statistics,
+                                         start_time_for_overall_testing, Path(temp_dir_for_generated_code),
+                                         vetted_programs))
+    if args.track_coverage_first:
+        # Each skipped program saves an asan/ubsan build and run, and an msan build and run.
+        print(f"Sanitizer checks were skipped for {vetting_statistics.sanitizer_checks_avoided} programs that covered "
+              f"no unkilled mutants.")
+
+
+def _still_testing(args: argparse.Namespace, killed_mutants: KilledMutants,
+                   start_time_for_overall_testing: float) -> bool:
+    return still_testing(total_test_time=args.total_test_time,
+                         maximum_time_since_last_kill=args.maximum_time_since_last_kill,
+                         start_time_for_overall_testing=start_time_for_overall_testing,
+                         time_of_last_kill=killed_mutants.time_of_last_kill)
+
+
+def _seed_worker(args: argparse.Namespace, worker_id: int) -> None:
+    # Each worker needs its own stream of random numbers: forked workers would otherwise all generate the same programs.
+    random.seed(None if args.seed is None else args.seed + worker_id)
+
+
+def _vetting_and_evaluation_worker(worker_id: int,
+                                   args: argparse.Namespace,
+                                   mutation_tree: MutationTree,
+                                   generate_program: ProgramGenerator,
+                                   killed_mutants: KilledMutants,
+                                   vetting_statistics: VettingStatistics,
+                                   start_time_for_overall_testing: float,
+                                   temp_dir_for_generated_code: Path) -> None:
+    _seed_worker(args, worker_id)
+    with open_kill_database(Path("work")) as kill_database:
+        while _still_testing(args, killed_mutants, start_time_for_overall_testing):
+            vetted_program: Optional[VettedProgram] = _vet_program(args, generate_program, killed_mutants,
+                                                                   vetting_statistics, temp_dir_for_generated_code)
+            if vetted_program is None:
+                continue
+            _evaluate_vetted_program(args, mutation_tree, vetted_program, killed_mutants, kill_database,
+                                     start_time_for_overall_testing)
+
+
+def _pipeline_worker(worker_id: int,
+                     args: argparse.Namespace,
+                     mutation_tree: MutationTree,
+                     generate_program: ProgramGenerator,
+                     killed_mutants: KilledMutants,
+                     vetting_statistics: VettingStatistics,
+                     start_time_for_overall_testing: float,
+                     temp_dir_for_generated_code: Path,
+                     vetted_programs: multiprocessing.Queue) -> None:
+    if worker_id < args.vetting_jobs:
+        # Vetted programs that are still buffered when testing stops are abandoned (the parent removes their
+        # directories), so do not let them hold up this worker's exit.
+        vetted_programs.cancel_join_thread()
+        _seed_worker(args, worker_id)
+        while _still_testing(args, killed_mutants, start_time_for_overall_testing):
+            vetted_program: Optional[VettedProgram] = _vet_program(args, generate_program, killed_mutants,
+                                                                   vetting_statistics, temp_dir_for_generated_code)
+            if vetted_program is None:
+                continue
+            while True:
+                try:
+                    vetted_programs.put(vetted_program, timeout=QUEUE_POLL_INTERVAL)
+                    break
+                except queue.Full:
+                    if not _still_testing(args, killed_mutants, start_time_for_overall_testing):
+                        return
+        return
+
+    with open_kill_database(Path("work")) as kill_database:
+        while _still_testing(args, killed_mutants, start_time_for_overall_testing):
+            try:
+                vetted_program: VettedProgram = vetted_programs.get(timeout=QUEUE_POLL_INTERVAL)
+            except queue.Empty:
+                continue
+            _evaluate_vetted_program(args, mutation_tree, vetted_program, killed_mutants, kill_database,
+                                     start_time_for_overall_testing)
+
+
+def _vet_program(args: argparse.Namespace,
+                 generate_program: ProgramGenerator,
+                 killed_mutants: KilledMutants,
+                 vetting_statistics: VettingStatistics,
+                 temp_dir_for_generated_code: Path) -> Optional[VettedProgram]:
+    program_dir: Path = Path(tempfile.mkdtemp(dir=temp_dir_for_generated_code))
+    vetted_program: Optional[VettedProgram] = None
+    try:
+        vetted_program = _vet_program_in_directory(args, generate_program, killed_mutants, vetting_statistics,
+                                                   program_dir)
+        return vetted_program
+    finally:
+        if vetted_program is None:
+            shutil.rmtree(program_dir)
+
+
+def _vet_program_in_directory(args: argparse.Namespace,
+                              generate_program: ProgramGenerator,
+                              killed_mutants: KilledMutants,
+                              vetting_statistics: VettingStatistics,
+                              program_dir: Path) -> Optional[VettedProgram]:
+    generated_program: Optional[GeneratedProgram] = generate_program(args, program_dir)
+    if generated_program is None:
+        return None
+
+    # The program is vetted separately in each configuration, as the executables it yields (and their run times, and
+    # the mutants that building them covers) differ between configurations. It is discarded if it fails in any of them.
+    configurations: List[VettedConfiguration] = []
+    for index, flags in enumerate(args.compiler_configurations):
+        test_name: str = generated_program.name if len(args.compiler_configurations) == 1\
+            else f"{generated_program.name}_{_configuration_suffix(flags)}"
+        print(f"Vetting {test_name} with compiler flags: {' '.join(flags)}")
+        configuration_dir: Path = Path(program_dir, f"configuration_{index}")
+        configuration_dir.mkdir()
+        configuration: Optional[VettedConfiguration] = _vet_configuration(args, test_name, flags,
+                                                                          flags + generated_program.compiler_args,
+                                                                          configuration_dir)
+        if configuration is None:
+            return None
+        configurations.append(configuration)
+
+    # Undefined behaviour is a property of the program rather than of how it is compiled, so the sanitizer checks are
+    # done once, using the flags of the first configuration.
+    sanitizer_compiler_args: List = configurations[0].compiler_args
+    if args.track_coverage_first:
+        # Vetting with sanitizers is by far the most expensive part of vetting, so do not spend it on a program that
+        # cannot kill any more mutants.
+        if not all(_track_covered_mutants(args, configuration) for configuration in configurations):
+            return None
+        if all(mutant in killed_mutants for configuration in configurations
+               for mutant in configuration.covered_mutants):
+            print(f"Skipping sanitizer checks, as the program covers no unkilled mutants. Programs skipped in this "
+                  f"way so far: {vetting_statistics.note_sanitizer_checks_avoided()}.")
+            return None
+        if not _passes_sanitizer_checks(args, sanitizer_compiler_args, program_dir):
+            return None
+    else:
+        if not _passes_sanitizer_checks(args, sanitizer_compiler_args, program_dir):
+            return None
+        if not all(_track_covered_mutants(args, configuration) for configuration in configurations):
+            return None
+
+    for configuration in configurations:
+        print(f"Compile time for {configuration.test_name}: {configuration.compile_timing}"
+              + ("" if configuration.original_sources_compile_timing is None
+                 else f"; from original sources: {configuration.original_sources_compile_timing}"))
+        print(f"Run time for {configuration.test_name}: {configuration.run_timing}")
+
+    return VettedProgram(generated_program=generated_program,
+                         program_dir=program_dir,
+                         configurations=configurations)
+
+
+# Compiles and runs the program without mutants in one configuration, with the configuration's flags included in
+# 'compiler_args', placing what is built in 'configuration_dir'. Returns None if the program fails to build or run
+# reliably. The mutants that the program covers in this configuration are not yet tracked.
+def _vet_configuration(args: argparse.Namespace,
+                       test_name: str,
+                       compiler_flags: List[str],
+                       compiler_args: List,
+                       configuration_dir: Path) -> Optional[VettedConfiguration]:
+    generated_program_exe_compiled_with_no_mutants = Path(configuration_dir, '__regular.exe')
+    generated_program_exe_compiled_from_original_sources = Path(configuration_dir, '__original_sources.exe')
+
+    # If requested, preprocess the program once, so that mutants can be compiled from the preprocessed sources.
+    preprocessed_sources: Optional[PreprocessedSources] = None
+    build_compiler_args: List[str] = compiler_args
+    if args.preprocess_once:
+        preprocessed_sources = PreprocessedSources(compiler_args, configuration_dir)
+        preprocess_result: ProcessResult = preprocessed_sources.preprocess(
+            compiler_path=str(args.mutated_compiler_executable),
+            timeout_seconds=args.compile_timeout)
+        if preprocess_result is None:
+            print("Preprocessing timed out.")
+            return None
+        if preprocess_result.returncode != 0:
+            print("Preprocessing failed.")
+            return None
+        build_compiler_args = preprocessed_sources.compiler_args
+
+    # Compile the program without mutation. In two-stage mode this is done in the same way that mutants will be built,
+    # so that the resulting executables are comparable.
+    two_stage_build: Optional[TwoStageBuild] = TwoStageBuild(build_compiler_args, configuration_dir)\
+        if args.two_stage_compilation else None
+    # The program is compiled and run within the memory limit that will apply to mutants, so that a program needing
+    # more memory than that is not mistaken for one whose mutants run out of memory.
+    memory_limit: Optional[int] = memory_limit_bytes(args.memory_limit_mb)
+    compile_timing: BaselineTiming = BaselineTiming(cpu_time=args.cpu_time_limits)
+    if two_stage_build is not None:
+        regular_compile_result: ProcessResult = compile_timing.measure(lambda: two_stage_build.build_regular(
+            compiler_path=str(args.mutated_compiler_executable),
+            exe_path=generated_program_exe_compiled_with_no_mutants,
+            timeout_seconds=args.compile_timeout,
+            memory_limit_bytes=memory_limit))
+    else:
+        regular_compile_cmd = [args.mutated_compiler_executable]\
+            + build_compiler_args\
+            + ["-o", generated_program_exe_compiled_with_no_mutants]
+        regular_compile_result: ProcessResult = compile_timing.measure(
+            lambda: run_process_with_timeout(cmd=regular_compile_cmd,
+                                             timeout_seconds=args.compile_timeout,
+                                             memory_limit_bytes=memory_limit))
+
+    if regular_compile_result is None:
+        print("Compiler timeout.")
+        return None
+    if regular_compile_result.memory_limit_exceeded:
+        print("Compilation without mutants exceeded the memory limit.")
+        return None
+    if regular_compile_result.returncode != 0:
+        print("Compilation failed without mutants.")
+        print(f"stdout: {regular_compile_result.stdout.decode('utf-8')}")
+        print(f"stderr: {regular_compile_result.stderr.decode('utf-8')}")
+        return None
+
+    regular_hash = BINARY_HASH_FUNCTIONS[args.binary_comparison](str(generated_program_exe_compiled_with_no_mutants))
+
+    original_sources_compile_timing: Optional[BaselineTiming] = None
+    if preprocessed_sources is not None:
+        # Compiling the preprocessed sources should give the same executable as compiling the original sources, which
+        # builds that enable mutants reached during preprocessing still do. Timing both shows how much time is saved
+        # per mutant compilation.
+        original_sources_compile_timing = BaselineTiming(cpu_time=args.cpu_time_limits)
+        original_sources_compile_result: ProcessResult = original_sources_compile_timing.measure(
+            lambda: run_process_with_timeout(cmd=[args.mutated_compiler_executable] + compiler_args
+                                             + ["-o", generated_program_exe_compiled_from_original_sources],
+                                             timeout_seconds=args.compile_timeout,
+                                             memory_limit_bytes=memory_limit))
+        if original_sources_compile_result is None or original_sources_compile_result.returncode != 0:
+            print("Compilation of original sources failed or timed out.")
+            return None
+        if BINARY_HASH_FUNCTIONS[args.binary_comparison](str(generated_program_exe_compiled_from_original_sources))\
+                != regular_hash:
+            print("Compiling the preprocessed sources gave a different executable to compiling the original sources.")
+            return None
+        print(f"Compile time from preprocessed sources: {compile_timing.estimate():.3f}s; from original sources: "
+              f"{original_sources_compile_timing.estimate():.3f}s; saving per mutant compilation: "
+              f"{original_sources_compile_timing.estimate() - compile_timing.estimate():.3f}s.")
+
+    run_timing: BaselineTiming = BaselineTiming(cpu_time=args.cpu_time_limits)
+    regular_execution_cmd: List[str] = [str(generated_program_exe_compiled_with_no_mutants)]
+    regular_execution_result: ProcessResult = run_timing.measure(
+        lambda: run_process_with_timeout(cmd=regular_execution_cmd, timeout_seconds=args.run_timeout,
+                                         memory_limit_bytes=memory_limit, digest_output=args.bounded_output_capture))
+
+    if regular_execution_result is None:
+        print("Runtime timeout.")
+        return None
+    if regular_execution_result.memory_limit_exceeded:
+        print("Execution of generated program exceeded the memory limit without mutants.")
+        return None
+    if regular_execution_result.returncode != 0:
+        print("Execution of generated program failed without mutants.")
+        return None
+    # Run the program some more times, to estimate its run time more reliably. Every run must behave in the same way:
+    # otherwise mutants could appear to be killed merely because the program's behaviour varies.
+    for _ in range(BASELINE_EXECUTION_SAMPLES - 1):
+        repeated_execution_result: ProcessResult = run_timing.measure(
+            lambda: run_process_with_timeout(cmd=regular_execution_cmd, timeout_seconds=args.run_timeout,
+                                             memory_limit_bytes=memory_limit,
+                                             digest_output=args.bounded_output_capture))
+        if repeated_execution_result is None\
+                or repeated_execution_result.returncode != regular_execution_result.returncode\
+                or repeated_execution_result.stdout != regular_execution_result.stdout\
+                or repeated_execution_result.stderr != regular_execution_result.stderr:
+            print("Repeated execution of generated program without mutants behaved differently.")
+            return None
+
+    return VettedConfiguration(test_name=test_name,
+                               compiler_flags=compiler_flags,
+                               compiler_args=compiler_args,
+                               configuration_dir=configuration_dir,
+                               compile_timing=compile_timing,
+                               original_sources_compile_timing=original_sources_compile_timing,
+                               run_timing=run_timing,
+                               regular_hash=regular_hash,
+                               regular_execution_result=regular_execution_result,
+                               two_stage_build=two_stage_build,
+                               preprocessed_sources=preprocessed_sources)
+
+
+# The sanitizers with which a generated program is checked for undefined behaviour, and the compiler flags that enable
+# each of them.
+SANITIZER_CHECKS: List[Tuple[str, List[str]]] = [
+    ("asan/ubsan", ["-fsanitize=address,undefined", "-fno-sanitize-recover=undefined"]),
+    ("msan", ["-fsanitize=memory"]),
+]
+
+
+async def _passes_sanitizer_check(args: argparse.Namespace,
+                                  compiler_args: List[str],
+                                  program_dir: Path,
+                                  sanitizer: str,
+                                  sanitizer_flags: List[str]) -> bool:
+    sanitizer_compiled_exe = Path(program_dir, f"__{sanitizer.replace('/', '_')}.exe")
+    compilation_result: Optional[ProcessResult] = await run_process_with_timeout_async(
+        ["clang-15"] + compiler_args + sanitizer_flags + ["-o", sanitizer_compiled_exe],
+        timeout_seconds=args.compile_timeout * 10)
+    if compilation_result is None:
+        print(f"Compilation of generated program with {sanitizer} timed out.")
+        return False
+    if compilation_result.returncode != 0:
+        print(f"Compilation of generated program with {sanitizer} failed.")
+        return False
+    execution_result: Optional[ProcessResult] = await run_process_with_timeout_async(
+        cmd=[str(sanitizer_compiled_exe)], timeout_seconds=args.run_timeout * 10)
+    if execution_result is None:
+        print(f"Execution of generated program with {sanitizer} timed out.")
+        return False
+    if execution_result.returncode != 0:
+        print(f"{sanitizer.capitalize()} error detected in generated program.")
+        return False
+    return True
+
+
+async def _all_pass(checks: List[Awaitable[bool]]) -> bool:
+    # Runs the checks concurrently, cancelling those that are still running (which kills their processes) as soon as
+    # one fails.
+    tasks: List[asyncio.Task] = [asyncio.ensure_future(check) for check in checks]
+    try:
+        for check in asyncio.as_completed(tasks):
+            if not await check:
+                return False
+        return True
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.wait(tasks)
+
+
+def _passes_sanitizer_checks(args: argparse.Namespace, compiler_args: List[str], program_dir: Path) -> bool:
+    # Compile and run the program with sanitizers - it should run without error. This is to guard against program
+    # generators sometimes emitting programs that feature undefined behaviour.
+    if args.concurrent_sanitizer_checks:
+        return asyncio.run(_all_pass([_passes_sanitizer_check(args, compiler_args, program_dir, sanitizer,
+                                                              sanitizer_flags)
+                                      for sanitizer, sanitizer_flags in SANITIZER_CHECKS]))
+    return all(asyncio.run(_passes_sanitizer_check(args, compiler_args, program_dir, sanitizer, sanitizer_flags))
+               for sanitizer, sanitizer_flags in SANITIZER_CHECKS)
+
+
+# Tracks the mutants that the program covers in the configuration, recording them in the configuration. Returns False
+# if tracking timed out.
+def _track_covered_mutants(args: argparse.Namespace, configuration: VettedConfiguration) -> bool:
+    dredd_covered_mutants_path: Path = Path(configuration.configuration_dir, '__dredd_covered_mutants')
+    generated_program_exe_compiled_with_mutant_tracking = Path(configuration.configuration_dir, '__tracking.exe')
+    two_stage_build: Optional[TwoStageBuild] = configuration.two_stage_build
+    preprocessed_sources: Optional[PreprocessedSources] = configuration.preprocessed_sources
+    tracking_compile_timing: BaselineTiming = configuration.tracking_compile_timing
+    # Mutants are tracked in the same way as they will be built, so that with --direct_cc1 a mutant that is only reached
+    # in the compiler driver, and so would never be enabled, is not counted as covered (and then as surviving).
+    driver_jobs: Optional[DriverJobCache] = DriverJobCache(configuration.configuration_dir) if args.direct_cc1 else None
+
+    if preprocessed_sources is not None and not preprocessed_sources.track_coverage(
+            tracking_compiler_path=str(args.mutant_tracking_compiler_executable),
+            timeout_seconds=args.compile_timeout):
+        print("Mutant tracking preprocessing timed out.")
+        return False
+
+    if two_stage_build is not None:
+        # Track the mutants covered by each source file separately, so that evaluating a mutant only needs to recompile
+        # the source files that cover it. The original sources are tracked, so that mutants reached during
+        # preprocessing are accounted for.
+        covered_by_this_test: Optional[List[int]] = tracking_compile_timing.measure(
+            lambda: two_stage_build.track_coverage(
+                tracking_compiler_path=str(args.mutant_tracking_compiler_executable),
+                timeout_seconds=args.compile_timeout,
+                sources=None if preprocessed_sources is None else preprocessed_sources.sources,
+                driver_jobs=driver_jobs))
+        if covered_by_this_test is None:
+            print("Mutant tracking compilation timed out.")
+            return False
+    else:
+        # Compile the program with the mutant tracking compiler.
+        tracking_environment = os.environ.copy()
+        tracking_environment["DREDD_MUTANT_TRACKING_FILE"] = str(dredd_covered_mutants_path)
+        tracking_compile_cmd = [args.mutant_tracking_compiler_executable]\
+            + configuration.compiler_args\
+            + ["-o", generated_program_exe_compiled_with_mutant_tracking]
+        run_compiler = run_process_with_timeout if driver_jobs is None else driver_jobs.run
+        if tracking_compile_timing.measure(lambda: run_compiler(cmd=tracking_compile_cmd,
+                                                                timeout_seconds=args.compile_timeout,
+                                                                env=tracking_environment)) is None:
+            print("Mutant tracking compilation timed out.")
+            return False
+
+        # Load file contents into a list. We go from list to set to list to eliminate duplicates.
+        covered_by_this_test: List[int] = list(set([int(line.strip()) for line in
+                                                    open(dredd_covered_mutants_path, 'r').readlines()]))
+        covered_by_this_test.sort()
+    configuration.covered_mutants = covered_by_this_test
+    return True
+
+
+def _evaluate_vetted_program(args: argparse.Namespace,
+                             mutation_tree: MutationTree,
+                             vetted_program: VettedProgram,
+                             killed_mutants: KilledMutants,
+                             kill_database: KillDatabase,
+                             start_time_for_overall_testing: float) -> None:
+    try:
+        for configuration in vetted_program.configurations:
+            if not _still_testing(args, killed_mutants, start_time_for_overall_testing):
+                break
+            _evaluate_mutants(args, mutation_tree, vetted_program.generated_program, configuration, killed_mutants,
+                              kill_database, start_time_for_overall_testing)
+    finally:
+        shutil.rmtree(vetted_program.program_dir)
+
+
+def _evaluate_mutants(args: argparse.Namespace,
+                      mutation_tree: MutationTree,
+                      generated_program: GeneratedProgram,
+                      configuration: VettedConfiguration,
+                      killed_mutants: KilledMutants,
+                      kill_database: KillDatabase,
+                      start_time_for_overall_testing: float) -> None:
+    test_name: str = configuration.test_name
+    mutant_exe = Path(configuration.configuration_dir, '__mutant.exe')
+
+    # Try to create a directory for this test. It is very unlikely that it already exists, but this could happen if two
+    # test workers pick the same seed. If that happens, this worker will skip the test.
+    test_output_directory: Path = Path("work/tests/" + test_name)
+    try:
+        test_output_directory.mkdir()
+    except FileExistsError:
+        print(f"Skipping test {test_name} as a directory for it already exists")
+        return
+    for name, path in generated_program.files_to_save.items():
+        shutil.copy(src=path, dst=test_output_directory / name)
+    (test_output_directory / COMPILER_FLAGS_FILENAME).write_text(shlex.join(configuration.compiler_flags) + "\n")
+
+    # Catch up with the mutants killed by other runners sharing the work directory, so that the candidates for this test
+    # are accurate. Kills by workers of this runner are already known, via shared memory.
+    killed_mutants.update(kill_database.get_killed_mutants())
+
+    covered_by_this_test: List[int] = configuration.covered_mutants
+    # Other workers may kill mutants at any time, so the killed set is consulted once per mutant, to make sure that each
+    # mutant ends up in exactly one of these lists.
+    candidate_mutants_for_this_test: List[int] = []
+    already_killed_by_other_tests: List[int] = []
+    for mutant in covered_by_this_test:
+        if mutant in killed_mutants:
+            already_killed_by_other_tests.append(mutant)
+        else:
+            candidate_mutants_for_this_test.append(mutant)
+    print(f"Number of mutants to try for {test_name}: " + str(len(candidate_mutants_for_this_test)))
+
+    killed_by_this_test: List[int] = []
+    covered_but_not_killed_by_this_test: List[int] = []
+
+    execution_cache: MutantExecutionCache = MutantExecutionCache()
+    timeout_statistics: TimeoutStatistics = TimeoutStatistics(configuration.compile_time, configuration.run_time)
+    driver_jobs: Optional[DriverJobCache] = DriverJobCache(configuration.configuration_dir) if args.direct_cc1 else None
+
+    def is_killed(mutant: int) -> bool:
+        if mutant in killed_mutants:
+            return True
+        if kill_database.is_killed(mutant):
+            killed_mutants.add(mutant)
+            return True
+        return False
+
+    def run_test(mutants: List[int]) -> KillStatus:
+        print("Trying mutants " + ', '.join([str(m) for m in mutants]))
+        result: KillStatus = run_test_with_mutants(mutants=mutants,
+                                                   compiler_path=str(args.mutated_compiler_executable),
+                                                   compiler_args=configuration.compiler_args,
+                                                   compile_time=configuration.compile_time,
+                                                   run_time=configuration.run_time,
+                                                   binary_hash_non_mutated=configuration.regular_hash,
+                                                   execution_result_non_mutated=configuration.regular_execution_result,
+                                                   mutant_exe_path=mutant_exe,
+                                                   execution_cache=execution_cache,
+                                                   hash_binary=BINARY_HASH_FUNCTIONS[args.binary_comparison],
+                                                   two_stage_build=configuration.two_stage_build,
+                                                   preprocessed_sources=configuration.preprocessed_sources,
+                                                   driver_jobs=driver_jobs,
+                                                   cpu_time_limits=args.cpu_time_limits,
+                                                   memory_limit=memory_limit_bytes(args.memory_limit_mb),
+                                                   streaming_output_comparison=args.streaming_output_comparison)
+        timeout_statistics.record(result)
+        print("Mutant result: " + str(result))
+        return result
+
+    # Lease mutants before testing them, so that other workers, possibly in other runners sharing the work directory,
+    # do not evaluate the same mutants at the same time.
+    lease_holder: str = lease_holder_id()
+
+    def claim(mutants: List[int]) -> List[int]:
+        return kill_database.acquire_leases(
+            mutants=mutants,
+            holder=lease_holder,
+            duration=max_runs_to_test_mutant_group(len(mutants))
+            * mutant_test_time_limit(configuration.compile_time, configuration.run_time, args.cpu_time_limits)
+            + MUTANT_LEASE_GRACE_PERIOD)
+
+    def release(mutants: List[int]) -> None:
+        kill_database.release_leases(mutants=mutants, holder=lease_holder)
+
+    # Whether testing stopped before all mutants had been tested. This is recorded when testing stops, rather than
+    # worked out afterwards, as a kill by another worker in the meantime could make testing appear to be ongoing.
+    stopped_early: bool = False
+
+    def still_testing_mutants() -> bool:
+        nonlocal stopped_early
+        if not _still_testing(args, killed_mutants, start_time_for_overall_testing):
+            stopped_early = True
+        return not stopped_early
+
+    for mutant, mutant_result in run_test_with_mutant_groups(
+            mutants=candidate_mutants_for_this_test,
+            mutation_tree=mutation_tree,
+            max_group_size=args.max_mutant_group_size,
+            run_test=run_test,
+            is_killed=is_killed,
+            still_testing=still_testing_mutants,
+            claim=claim,
+            release=release):
+
+        if mutant_result is None:
+            print("Skipping mutant " + str(mutant) + " as it is noted as already killed.")
+            already_killed_by_other_tests.append(mutant)
+            continue
+
+        if is_survived(mutant_result):
+            covered_but_not_killed_by_this_test.append(mutant)
+            continue
+
+        killed_mutants.add(mutant)
+        killed_mutants.note_kill()
+        killed_by_this_test.append(mutant)
+        print(f"Kill! Mutants killed so far: {len(killed_mutants)}")
+        if kill_database.add_kill(mutant=mutant, killing_test=test_name, kill_type=str(mutant_result)):
+            print("Recorded kill in database.")
+        else:
+            print(f"Mutant {mutant} was independently discovered to be killed.")
+
+    print(f"Mutant execution cache for {test_name}: {execution_cache}")
+    print(f"Mutant timeouts for {test_name}: {timeout_statistics}")
+
+    all_considered_mutants = killed_by_this_test \
+        + covered_but_not_killed_by_this_test \
+        + already_killed_by_other_tests
+    all_considered_mutants.sort()
+
+    if covered_by_this_test != all_considered_mutants:
+        assert stopped_early
+        terminated_early: bool = True
+    else:
+        terminated_early: bool = False
+
+    killed_by_this_test.sort()
+    covered_but_not_killed_by_this_test.sort()
+    already_killed_by_other_tests.sort()
+    kill_database.add_test_summary(test=test_name,
+                                   terminated_early=terminated_early,
+                                   covered_mutants=covered_by_this_test,
+                                   killed_mutants=killed_by_this_test,
+                                   skipped_mutants=already_killed_by_other_tests,
+                                   survived_mutants=covered_but_not_killed_by_this_test)
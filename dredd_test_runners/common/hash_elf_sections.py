@@ -0,0 +1,88 @@
+import hashlib
+import struct
+
+from dredd_test_runners.common.hash_file import hash_file
+
+from typing import List, Optional, Tuple
+
+ELF_MAGIC: bytes = b'\x7fELF'
+ELF_CLASS_32: int = 1
+ELF_CLASS_64: int = 2
+ELF_DATA_LITTLE_ENDIAN: int = 1
+ELF_DATA_BIG_ENDIAN: int = 2
+
+SHT_NOBITS: int = 8
+SHT_NOTE: int = 7
+SHF_ALLOC: int = 0x2
+SHN_XINDEX: int = 0xffff
+
+# Layouts of the ELF file header following the 16-byte identification (type, machine, version, entry, program header
+# offset, section header offset, flags, header size, program header entry size and count, section header entry size and
+# count, section name string table index), and of a section header (name, type, flags, address, offset, size, link,
+# info, alignment, entry size), for 32- and 64-bit files.
+_FILE_HEADER_FORMATS = {ELF_CLASS_32: 'HHIIIIIHHHHHH', ELF_CLASS_64: 'HHIQQQIHHHHHH'}
+_SECTION_HEADER_FORMATS = {ELF_CLASS_32: 'IIIIIIIIII', ELF_CLASS_64: 'IIQQQQIIQQ'}
+
+
+def _parse_sections(contents: bytes) -> Optional[Tuple[Tuple, List[Tuple[bytes, Tuple]]]]:
+    # Returns the file header and the name and header of every section, or None if the contents are not those of a
+    # well-formed ELF file.
+    if len(contents) < 16 or contents[:4] != ELF_MAGIC:
+        return None
+    elf_class: int = contents[4]
+    if elf_class not in _FILE_HEADER_FORMATS or contents[5] not in (ELF_DATA_LITTLE_ENDIAN, ELF_DATA_BIG_ENDIAN):
+        return None
+    byte_order: str = '<' if contents[5] == ELF_DATA_LITTLE_ENDIAN else '>'
+    file_header_format: str = byte_order + _FILE_HEADER_FORMATS[elf_class]
+    section_header_format: str = byte_order + _SECTION_HEADER_FORMATS[elf_class]
+    try:
+        file_header = struct.unpack_from(file_header_format, contents, 16)
+        section_header_offset, section_header_size, num_sections, section_names_index = \
+            file_header[5], file_header[10], file_header[11], file_header[12]
+        if section_header_offset == 0 or section_header_size < struct.calcsize(section_header_format):
+            return None
+        first_section_header = struct.unpack_from(section_header_format, contents, section_header_offset)
+        # Files with very many sections store the number of sections, and the index of the section name string table,
+        # in the first section header.
+        if num_sections == 0:
+            num_sections = first_section_header[5]
+        if section_names_index == SHN_XINDEX:
+            section_names_index = first_section_header[6]
+        section_headers = [struct.unpack_from(section_header_format, contents,
+                                              section_header_offset + index * section_header_size)
+                           for index in range(num_sections)]
+        section_names_header = section_headers[section_names_index]
+    except (struct.error, IndexError):
+        return None
+    section_names: bytes = contents[section_names_header[4]:section_names_header[4] + section_names_header[5]]
+    sections: List[Tuple[bytes, Tuple]] = []
+    for section_header in section_headers:
+        name_end: int = section_names.find(b'\0', section_header[0])
+        sections.append((section_names[section_header[0]:name_end if name_end >= 0 else len(section_names)],
+                         section_header))
+    return file_header, sections
+
+
+def hash_elf_sections(filename: str) -> str:
+    # Hashes the parts of an ELF executable that can affect its behaviour when run: its entry point, and the name,
+    # address, flags and contents of each section that is loaded into memory, such as .text, .data and .rodata.
+    # Sections that are not loaded (the symbol table, debug information, comments) and notes (such as the build id)
+    # are ignored, so that executables differing only in those have the same hash. Files that are not ELF files are
+    # hashed in their entirety.
+    with open(filename, 'rb') as infile:
+        contents: bytes = infile.read()
+    parsed = _parse_sections(contents)
+    if parsed is None:
+        return hash_file(filename)
+    file_header, sections = parsed
+    md5_hash = hashlib.md5()
+    md5_hash.update(contents[:16])
+    # Type, machine and entry point.
+    md5_hash.update(repr((file_header[0], file_header[1], file_header[3])).encode('utf-8'))
+    for name, (_, section_type, flags, address, offset, size, _, _, _, _) in sections:
+        if not flags & SHF_ALLOC or section_type == SHT_NOTE:
+            continue
+        md5_hash.update(repr((name, section_type, flags, address, size)).encode('utf-8'))
+        if section_type != SHT_NOBITS:
+            md5_hash.update(contents[offset:offset + size])
+    return md5_hash.hexdigest()
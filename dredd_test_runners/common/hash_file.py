@@ -3,5 +3,8 @@ import hashlib
 
 def hash_file(filename: str) -> str:
     md5_hash = hashlib.md5()
-    md5_hash.update(open(filename, 'rb').read())
+    with open(filename, 'rb') as infile:
+        # Read in chunks, so that hashing a large file does not require it to be held in memory.
+        for chunk in iter(lambda: infile.read(1 << 20), b''):
+            md5_hash.update(chunk)
     return md5_hash.hexdigest()
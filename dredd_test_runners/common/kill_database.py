@@ -0,0 +1,204 @@
+import json
+import os
+import socket
+import sqlite3
+import time
+
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, List, Optional, Set, Tuple
+
+# The name of the kill database within a work directory.
+KILL_DATABASE_FILENAME: str = "kills.db"
+
+# Time in seconds for which a connection waits for another process to finish writing to the database before giving up.
+DATABASE_BUSY_TIMEOUT: float = 60.0
+
+# Extra time, in seconds, for which a lease on mutants is held beyond the longest time that evaluating them should take.
+# A lease held by a worker that crashes expires after this long at most.
+MUTANT_LEASE_GRACE_PERIOD: float = 10.0
+
+# The outcome recorded for each mutant covered by a test. A mutant that was covered but not considered, because testing
+# stopped early, has outcome 'not_considered'.
+OUTCOME_KILLED: str = "killed"
+OUTCOME_SKIPPED: str = "skipped"
+OUTCOME_SURVIVED: str = "survived"
+OUTCOME_NOT_CONSIDERED: str = "not_considered"
+
+_SCHEMA: str = """
+CREATE TABLE IF NOT EXISTS kills (
+    mutant INTEGER PRIMARY KEY,
+    killing_test TEXT NOT NULL,
+    kill_type TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS tests (
+    name TEXT PRIMARY KEY,
+    terminated_early INTEGER
+);
+CREATE TABLE IF NOT EXISTS test_mutants (
+    test TEXT NOT NULL,
+    mutant INTEGER NOT NULL,
+    outcome TEXT NOT NULL,
+    PRIMARY KEY (test, mutant)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS test_mutants_by_mutant ON test_mutants (mutant);
+CREATE TABLE IF NOT EXISTS leases (
+    mutant INTEGER PRIMARY KEY,
+    holder TEXT NOT NULL,
+    expiry_time REAL NOT NULL
+);
+"""
+
+
+def lease_holder_id() -> str:
+    # Identifies the current process among all processes that might share a work directory.
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+class KillDatabase:
+    # A record of which mutants have been killed, by which tests and how, together with a summary of the mutants that
+    # each test covered and what happened to them. The database is a single SQLite file in write-ahead logging mode, so
+    # that any number of processes can read it and add to it concurrently.
+    #
+    # A connection must not be shared between processes: each worker process should open its own.
+    def __init__(self, database_file: Path):
+        self._connection = sqlite3.connect(database_file, timeout=DATABASE_BUSY_TIMEOUT, isolation_level=None)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        with self._transaction():
+            for statement in _SCHEMA.split(';'):
+                if statement.strip():
+                    self._connection.execute(statement)
+
+    def close(self) -> None:
+        self._connection.close()
+
+    def __enter__(self) -> 'KillDatabase':
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        self.close()
+
+    @contextmanager
+    def _transaction(self):
+        # Takes the database's write lock up front, so that the transaction cannot fail part way through because another
+        # process has started writing.
+        self._connection.execute("BEGIN IMMEDIATE")
+        try:
+            yield
+        except BaseException:
+            self._connection.execute("ROLLBACK")
+            raise
+        self._connection.execute("COMMIT")
+
+    # Records that the mutant has been killed, unless it has already been recorded as killed, in which case the existing
+    # record is kept: the first test to kill a mutant is credited with the kill. Returns True if and only if this call
+    # recorded the kill.
+    def add_kill(self, mutant: int, killing_test: str, kill_type: str) -> bool:
+        cursor = self._connection.execute("INSERT OR IGNORE INTO kills (mutant, killing_test, kill_type) "
+                                          "VALUES (?, ?, ?)", (mutant, killing_test, kill_type))
+        return cursor.rowcount == 1
+
+    def is_killed(self, mutant: int) -> bool:
+        return self._connection.execute("SELECT 1 FROM kills WHERE mutant = ?", (mutant,)).fetchone() is not None
+
+    def get_killed_mutants(self) -> Set[int]:
+        return {row[0] for row in self._connection.execute("SELECT mutant FROM kills")}
+
+    # Leases are used to stop workers from duplicating each other's work: a worker about to evaluate mutants takes out
+    # leases on them, and other workers defer evaluating those mutants until the leases are released or expire. Leases
+    # expire so that work is not blocked forever by a worker that crashes.
+    #
+    # Tries to take out a lease on each of the given mutants, on behalf of 'holder', lasting 'duration' seconds. A
+    # mutant can be leased unless another lease on it is live. Returns the mutants that were leased.
+    def acquire_leases(self, mutants: List[int], holder: str, duration: float) -> List[int]:
+        now: float = time.time()
+        leased: List[int] = []
+        with self._transaction():
+            for mutant in mutants:
+                self._connection.execute("DELETE FROM leases WHERE mutant = ? AND expiry_time < ?", (mutant, now))
+                cursor = self._connection.execute("INSERT OR IGNORE INTO leases (mutant, holder, expiry_time) "
+                                                  "VALUES (?, ?, ?)", (mutant, holder, now + duration))
+                if cursor.rowcount == 1:
+                    leased.append(mutant)
+        return leased
+
+    def release_leases(self, mutants: List[int], holder: str) -> None:
+        with self._transaction():
+            self._connection.executemany("DELETE FROM leases WHERE mutant = ? AND holder = ?",
+                                         [(mutant, holder) for mutant in mutants])
+
+    # Records the outcome of running a test against the mutants it covers. 'terminated_early' is None for runners that
+    # always consider every covered mutant. Returns False, recording nothing, if a summary for the test already exists.
+    def add_test_summary(self,
+                         test: str,
+                         terminated_early: Optional[bool],
+                         covered_mutants: List[int],
+                         killed_mutants: List[int],
+                         skipped_mutants: List[int],
+                         survived_mutants: List[int]) -> bool:
+        outcomes: Dict[int, str] = {mutant: OUTCOME_NOT_CONSIDERED for mutant in covered_mutants}
+        for mutants, outcome in [(killed_mutants, OUTCOME_KILLED),
+                                 (skipped_mutants, OUTCOME_SKIPPED),
+                                 (survived_mutants, OUTCOME_SURVIVED)]:
+            for mutant in mutants:
+                outcomes[mutant] = outcome
+        with self._transaction():
+            cursor = self._connection.execute("INSERT OR IGNORE INTO tests (name, terminated_early) VALUES (?, ?)",
+                                              (test, terminated_early))
+            if cursor.rowcount != 1:
+                return False
+            self._connection.executemany("INSERT INTO test_mutants (test, mutant, outcome) VALUES (?, ?, ?)",
+                                         [(test, mutant, outcome) for mutant, outcome in outcomes.items()])
+        return True
+
+    # Returns, for every mutant killed by a test whose name starts with the given prefix, the test, the mutant and the
+    # mutant's kill info. A mutant killed by several tests is reported for each of them; its kill info names the test
+    # that was credited with the kill.
+    def get_kills_by_tests(self, test_name_prefix: str = "") -> List[Tuple[str, int, Dict]]:
+        rows = self._connection.execute(
+            "SELECT test_mutants.test, kills.mutant, kills.killing_test, kills.kill_type "
+            "FROM test_mutants JOIN kills ON kills.mutant = test_mutants.mutant "
+            "WHERE test_mutants.outcome = ? AND substr(test_mutants.test, 1, ?) = ? "
+            "ORDER BY test_mutants.test, kills.mutant",
+            (OUTCOME_KILLED, len(test_name_prefix), test_name_prefix))
+        return [(test, mutant, {"killing_test": killing_test, "kill_type": kill_type})
+                for test, mutant, killing_test, kill_type in rows]
+
+
+def open_kill_database(work_dir: Path) -> KillDatabase:
+    return KillDatabase(work_dir / KILL_DATABASE_FILENAME)
+
+
+def import_work_directory(work_dir: Path, kill_database: KillDatabase) -> Tuple[int, int]:
+    # Imports results recorded by earlier versions of the runners, as a 'kill_info.json' file under
+    # 'work_dir/killed_mutants/<mutant>' for each killed mutant and a 'kill_summary.json' file under
+    # 'work_dir/tests/<test>' for each test. Results already in the database are kept. Returns the numbers of kills and
+    # test summaries that were imported.
+    kills_imported: int = 0
+    for mutant_dir in sorted((work_dir / "killed_mutants").glob('*')):
+        if not mutant_dir.name.isdigit():
+            continue
+        kill_info_file: Path = mutant_dir / "kill_info.json"
+        if not kill_info_file.exists():
+            print(f"Warning: not importing kill of mutant {mutant_dir.name}, as it has no kill info.")
+            continue
+        kill_info: Dict = json.load(open(kill_info_file, 'r'))
+        if kill_database.add_kill(int(mutant_dir.name), kill_info["killing_test"], kill_info["kill_type"]):
+            kills_imported += 1
+
+    summaries_imported: int = 0
+    for test_dir in sorted((work_dir / "tests").glob('*')):
+        kill_summary_file: Path = test_dir / "kill_summary.json"
+        if not kill_summary_file.exists():
+            continue
+        kill_summary: Dict = json.load(open(kill_summary_file, 'r'))
+        # Summaries written by the LLVM test suite and regression test runners name their test explicitly.
+        if kill_database.add_test_summary(test=kill_summary.get("test", test_dir.name),
+                                          terminated_early=kill_summary.get("terminated_early"),
+                                          covered_mutants=kill_summary["covered_mutants"],
+                                          killed_mutants=kill_summary["killed_mutants"],
+                                          skipped_mutants=kill_summary["skipped_mutants"],
+                                          survived_mutants=kill_summary["survived_mutants"]):
+            summaries_imported += 1
+    return kills_imported, summaries_imported
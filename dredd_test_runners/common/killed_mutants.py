@@ -0,0 +1,58 @@
+import ctypes
+import multiprocessing
+import time
+
+from typing import Iterable, List
+
+
+class KilledMutants:
+    # Records which mutants have been killed, and when the most recent kill occurred. The state is held in shared
+    # memory, so that when worker processes are forked from the process that created this object, a kill discovered by
+    # one worker is immediately visible to all the others.
+    def __init__(self, num_mutations: int):
+        self._killed = multiprocessing.Array(ctypes.c_bool, num_mutations, lock=False)
+        self._num_killed = multiprocessing.Value(ctypes.c_long, 0)
+        self._time_of_last_kill = multiprocessing.Value(ctypes.c_double, time.time())
+
+    def __contains__(self, mutant: int) -> bool:
+        return self._killed[mutant]
+
+    def __len__(self) -> int:
+        return self._num_killed.value
+
+    # Returns True if and only if the mutant was not already known to be killed.
+    def add(self, mutant: int) -> bool:
+        with self._num_killed.get_lock():
+            if self._killed[mutant]:
+                return False
+            self._killed[mutant] = True
+            self._num_killed.value += 1
+            return True
+
+    # Adds mutants found to be killed elsewhere, e.g. by another runner sharing the work directory. Returns the number
+    # of mutants that were not already known to be killed. Mutants that are not in the mutation tree, as happens if the
+    # kills were recorded against a different tree, are skipped and reported.
+    def update(self, mutants: Iterable[int]) -> int:
+        num_added: int = 0
+        out_of_range: List[int] = []
+        with self._num_killed.get_lock():
+            for mutant in mutants:
+                if not 0 <= mutant < len(self._killed):
+                    out_of_range.append(mutant)
+                    continue
+                if not self._killed[mutant]:
+                    self._killed[mutant] = True
+                    num_added += 1
+            self._num_killed.value += num_added
+        if out_of_range:
+            print(f"Warning: ignoring {len(out_of_range)} killed mutants that are not in the mutation tree, which has "
+                  f"{len(self._killed)} mutants (e.g. mutant {out_of_range[0]}); the kill database may have been "
+                  f"recorded against a different mutation tree.")
+        return num_added
+
+    def note_kill(self) -> None:
+        self._time_of_last_kill.value = time.time()
+
+    @property
+    def time_of_last_kill(self) -> float:
+        return self._time_of_last_kill.value
@@ -0,0 +1,124 @@
+import argparse
+import time
+
+from dredd_test_runners.common.argument_types import positive_int
+from dredd_test_runners.common.mutation_tree import MutationTree
+from dredd_test_runners.common.run_test_with_mutants import KillStatus
+
+from typing import Callable, Iterator, List, Optional, Set, Tuple
+
+# Time in seconds to wait before trying again to claim mutants that are being evaluated by other workers, when there is
+# nothing else left to do.
+DEFERRED_MUTANT_RETRY_INTERVAL: float = 1.0
+
+
+def add_max_mutant_group_size_argument(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument("--max_mutant_group_size",
+                        default=1,
+                        help="Maximum number of mutually compatible mutants to enable together when testing. Mutants "
+                             "in a group that survives all survive; a group that is killed is bisected to identify "
+                             "the killed mutants. Default is 1, i.e. test mutants one at a time.",
+                        type=positive_int)
+
+
+def is_survived(kill_status: KillStatus) -> bool:
+    return kill_status == KillStatus.SURVIVED_IDENTICAL or kill_status == KillStatus.SURVIVED_BINARY_DIFFERENCE
+
+
+def take_compatible_mutant_group(mutants: List[int],
+                                 mutation_tree: MutationTree,
+                                 max_group_size: int) -> Tuple[List[int], List[int]]:
+    # Greedily selects up to 'max_group_size' mutants from 'mutants' such that no selected mutant is incompatible with
+    # another, i.e. no selected mutant lies in the same node, or in an ancestor or descendant of the node, of another.
+    # Such mutants can be enabled together. Returns the selected group and the remaining mutants, in their original
+    # order.
+    group: List[int] = []
+    remaining: List[int] = []
+    incompatible_with_group: Set[int] = set()
+    for mutant in mutants:
+        if len(group) < max_group_size and mutant not in incompatible_with_group:
+            group.append(mutant)
+            if len(group) < max_group_size:
+                incompatible_with_group.update(mutation_tree.get_incompatible_mutation_ids(mutant))
+        else:
+            remaining.append(mutant)
+    return group, remaining
+
+
+def max_runs_to_test_mutant_group(group_size: int) -> int:
+    # Bisecting a group runs the test at most once for each node of a binary tree with 'group_size' leaves.
+    return 2 * group_size - 1
+
+
+def run_test_with_mutant_groups(mutants: List[int],
+                                mutation_tree: MutationTree,
+                                max_group_size: int,
+                                run_test: Callable[[List[int]], KillStatus],
+                                is_killed: Callable[[int], bool],
+                                still_testing: Callable[[], bool],
+                                claim: Optional[Callable[[List[int]], List[int]]] = None,
+                                release: Optional[Callable[[List[int]], None]] = None)\
+        -> Iterator[Tuple[int, Optional[KillStatus]]]:
+    # Determines the outcome of the test for each of the given mutants, by adaptive group testing: a group of compatible
+    # mutants is enabled at once, and if the test does not kill the group then all of its mutants are deemed to
+    # survive. Otherwise, the group is bisected to find out which of its mutants the test kills. The group size is
+    # doubled (up to 'max_group_size') after a group survives, and halved after a group is killed, so that fewer
+    # mutants are tested together when kills are frequent.
+    #
+    # Yields each mutant paired with its result, or with None if the mutant was found to be killed already (according
+    # to 'is_killed') before it was tested. Stops early if 'still_testing' returns False. A 'max_group_size' of 1
+    # amounts to testing each mutant in turn.
+    #
+    # Group testing assumes that a mutant that is killed on its own is also killed when enabled with other mutants. In
+    # rare cases mutants can mask one another, so that some kills are missed.
+    #
+    # If 'claim' is given, it is called with each group of mutants that are about to be tested, and returns those that
+    # the caller may test; the others are presumed to be under evaluation by another worker, and are deferred until
+    # everything else has been tested, in the hope that they will be killed in the meantime. 'release' is called with
+    # the claimed mutants once they have been tested and their results yielded.
+    remaining: List[int] = mutants
+    deferred: List[int] = []
+    group_size: int = max_group_size
+    while remaining or deferred:
+        if not still_testing():
+            return
+        if not remaining:
+            time.sleep(DEFERRED_MUTANT_RETRY_INTERVAL)
+            remaining, deferred = deferred, []
+        group, remaining = take_compatible_mutant_group(remaining, mutation_tree, group_size)
+        untested_group: List[int] = []
+        for mutant in group:
+            if is_killed(mutant):
+                yield mutant, None
+            else:
+                untested_group.append(mutant)
+        if claim is not None and untested_group:
+            claimed: List[int] = claim(untested_group)
+            deferred += [mutant for mutant in untested_group if mutant not in claimed]
+            untested_group = claimed
+        if not untested_group:
+            continue
+        group = untested_group
+        group_killed: bool = False
+        try:
+            for mutant, result in _bisect_mutant_group(group, run_test(group), run_test, still_testing):
+                group_killed = group_killed or not is_survived(result)
+                yield mutant, result
+        finally:
+            if release is not None:
+                release(group)
+        group_size = max(1, group_size // 2) if group_killed else min(max_group_size, group_size * 2)
+
+
+def _bisect_mutant_group(group: List[int],
+                         group_result: KillStatus,
+                         run_test: Callable[[List[int]], KillStatus],
+                         still_testing: Callable[[], bool]) -> Iterator[Tuple[int, KillStatus]]:
+    if len(group) == 1 or is_survived(group_result):
+        for mutant in group:
+            yield mutant, group_result
+        return
+    for half in [group[:len(group) // 2], group[len(group) // 2:]]:
+        if not still_testing():
+            return
+        yield from _bisect_mutant_group(half, run_test(half), run_test, still_testing)
@@ -0,0 +1,210 @@
+import json
+import re
+
+from dredd_test_runners.common.mutation_tree import MutationTree, MutationTreeBuilder, get_mutation_ids_for_json_node
+
+from json.decoder import scanstring
+from pathlib import Path
+from typing import Any, List, Optional, TextIO, Tuple
+
+# Reads a Dredd mutation info file as a stream of JSON tokens, building the mutation tree as nodes are encountered.
+# Only the mutation groups of one node at a time are ever materialized as Python objects, so memory usage is bounded by
+# the size of the resulting tree rather than by the size of the JSON document, which for a large program such as a
+# compiler runs to hundreds of megabytes.
+
+READ_CHUNK_SIZE: int = 1 << 20
+
+# Matches optional whitespace followed by the start of a JSON token. A string token is matched only by its opening
+# quote; its remainder is scanned by json.decoder.scanstring.
+_TOKEN_REGEX = re.compile(r'[ \t\n\r]*(?:([{}\[\]:,])|(")|(-?(?:0|[1-9][0-9]*)(?:\.[0-9]+)?(?:[eE][-+]?[0-9]+)?)'
+                          r'|(true|false|null))')
+
+_LITERALS = {'true': True, 'false': False, 'null': None}
+
+# Token kinds, other than punctuation, which is represented by the punctuation character itself.
+STRING_TOKEN: str = 'string'
+NUMBER_TOKEN: str = 'number'
+LITERAL_TOKEN: str = 'literal'
+END_TOKEN: str = 'end'
+
+
+class JsonTokenStream:
+    # Splits JSON text, read in chunks from a file, into tokens. Each token is a pair of the token's kind and its value;
+    # the value of a punctuation token is the punctuation character.
+    def __init__(self, infile: TextIO):
+        self._infile: TextIO = infile
+        self._buffer: str = ''
+        self._position: int = 0
+        self._end_of_input: bool = False
+
+    def _read_more(self) -> bool:
+        # Appends the next chunk of input to the unconsumed part of the buffer. Returns False at the end of the input.
+        if self._end_of_input:
+            return False
+        chunk: str = self._infile.read(READ_CHUNK_SIZE)
+        if not chunk:
+            self._end_of_input = True
+            return False
+        self._buffer = self._buffer[self._position:] + chunk
+        self._position = 0
+        return True
+
+    def next_token(self) -> Tuple[str, Any]:
+        while True:
+            match = _TOKEN_REGEX.match(self._buffer, self._position)
+            # A number or literal near the end of the buffer may continue in the next chunk, so is only accepted if it
+            # is followed by enough characters to show that it is complete (a number such as '1.5e+2' may be matched
+            # as '1.5' when the buffer ends after 'e+'), or once the input is exhausted.
+            if match is None or (len(self._buffer) - match.end() <= 2 and not match.group(1) and not match.group(2)):
+                if self._read_more():
+                    continue
+                if match is None:
+                    if self._buffer[self._position:].strip():
+                        raise ValueError(f"Invalid JSON near: {self._buffer[self._position:self._position + 40]!r}")
+                    return END_TOKEN, None
+            if match.group(1):
+                self._position = match.end()
+                return match.group(1), match.group(1)
+            if match.group(2):
+                try:
+                    value, end = scanstring(self._buffer, match.end())
+                except json.JSONDecodeError:
+                    # The string is unterminated, or ends with a partial escape sequence; it may continue in the next
+                    # chunk.
+                    self._position = match.start(2)
+                    if self._read_more():
+                        continue
+                    raise
+                self._position = end
+                return STRING_TOKEN, value
+            self._position = match.end()
+            if match.group(3):
+                text: str = match.group(3)
+                return NUMBER_TOKEN, float(text) if any(c in text for c in '.eE') else int(text)
+            return LITERAL_TOKEN, _LITERALS[match.group(4)]
+
+    def expect(self, expected_kind: str) -> Any:
+        kind, value = self.next_token()
+        if kind != expected_kind:
+            raise ValueError(f"Expected '{expected_kind}' in JSON, found '{kind}'")
+        return value
+
+    def read_value(self, first_token: Optional[Tuple[str, Any]] = None) -> Any:
+        # Materializes the next JSON value. This is recursive, so should only be used for values of modest depth.
+        kind, value = self.next_token() if first_token is None else first_token
+        if kind == '{':
+            result_object = {}
+            for key in self.object_keys():
+                result_object[key] = self.read_value()
+            return result_object
+        if kind == '[':
+            result_array = []
+            for element_first_token in self.array_elements():
+                result_array.append(self.read_value(element_first_token))
+            return result_array
+        if kind not in (STRING_TOKEN, NUMBER_TOKEN, LITERAL_TOKEN):
+            raise ValueError(f"Unexpected '{kind}' in JSON")
+        return value
+
+    def skip_value(self, first_token: Optional[Tuple[str, Any]] = None) -> None:
+        # Consumes the next JSON value without materializing it, however deeply nested it is.
+        kind, _ = self.next_token() if first_token is None else first_token
+        depth: int = 0
+        while True:
+            if kind in ('{', '['):
+                depth += 1
+            elif kind in ('}', ']'):
+                depth -= 1
+            elif kind == END_TOKEN:
+                raise ValueError("Unexpected end of JSON")
+            if depth == 0:
+                return
+            kind, _ = self.next_token()
+
+    def object_keys(self):
+        # Having consumed the '{' that opens an object, yields each of the object's keys. The caller must consume the
+        # corresponding value before asking for the next key.
+        kind, value = self.next_token()
+        if kind == '}':
+            return
+        while True:
+            if kind != STRING_TOKEN:
+                raise ValueError(f"Expected an object key in JSON, found '{kind}'")
+            self.expect(':')
+            yield value
+            kind, _ = self.next_token()
+            if kind == '}':
+                return
+            if kind != ',':
+                raise ValueError(f"Expected ',' or '}}' in JSON, found '{kind}'")
+            kind, value = self.next_token()
+
+    def array_elements(self):
+        # Having consumed the '[' that opens an array, yields the first token of each of the array's elements. The
+        # caller must consume the rest of the element before asking for the next one.
+        token = self.next_token()
+        if token[0] == ']':
+            return
+        while True:
+            yield token
+            kind, _ = self.next_token()
+            if kind == ']':
+                return
+            if kind != ',':
+                raise ValueError(f"Expected ',' or ']' in JSON, found '{kind}'")
+            token = self.next_token()
+
+
+def _read_mutation_tree_node(tokens: JsonTokenStream, builder: MutationTreeBuilder) -> None:
+    # Reads a mutation tree root node, whose opening '{' has been consumed, and all of its descendants. Nodes can be
+    # nested very deeply, so rather than recursing, this keeps a stack of the key iterators of the node objects that
+    # are currently open, paired with the node ids and with the element iterators of their 'children' arrays, if open.
+    stack: List[Tuple[int, Any, Any]] = [(builder.add_node(-1), tokens.object_keys(), None)]
+    while stack:
+        node_id, keys, children = stack[-1]
+        if children is not None:
+            child_first_token = next(children, None)
+            if child_first_token is None:
+                stack[-1] = (node_id, keys, None)
+                continue
+            if child_first_token[0] != '{':
+                raise ValueError("Expected a mutation tree node in JSON")
+            stack.append((builder.add_node(node_id), tokens.object_keys(), None))
+            continue
+        key = next(keys, None)
+        if key is None:
+            stack.pop()
+        elif key == "children":
+            tokens.expect('[')
+            stack[-1] = (node_id, keys, tokens.array_elements())
+        elif key == "mutationGroups":
+            builder.add_mutation_ids(node_id, get_mutation_ids_for_json_node({"mutationGroups": tokens.read_value()}))
+        else:
+            tokens.skip_value()
+
+
+def read_mutation_tree_from_stream(infile: TextIO) -> MutationTree:
+    # Equivalent to MutationTree(json.load(infile)), without loading the whole JSON document into memory.
+    tokens = JsonTokenStream(infile)
+    builder = MutationTreeBuilder()
+    tokens.expect('{')
+    for key in tokens.object_keys():
+        if key != "infoForFiles":
+            tokens.skip_value()
+            continue
+        tokens.expect('[')
+        for file_first_token in tokens.array_elements():
+            if file_first_token[0] != '{':
+                raise ValueError("Expected a file object in JSON")
+            for file_key in tokens.object_keys():
+                if file_key != "mutationTreeRoot":
+                    tokens.skip_value()
+                    continue
+                tokens.expect('{')
+                _read_mutation_tree_node(tokens, builder)
+    return builder.build()
+
+
+def read_mutation_tree_from_file(mutation_info_file: Path) -> MutationTree:
+    with open(mutation_info_file, 'r') as infile:
+        return read_mutation_tree_from_stream(infile)
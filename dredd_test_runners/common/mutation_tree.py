@@ -1,6 +1,10 @@
-import functools
+import hashlib
+import sys
 
-from typing import List
+from array import array
+from typing import List, Optional, Tuple
+
+FINGERPRINT_SIZE: int = 16
 
 
 def get_mutation_ids_for_mutation_group(mutation_group):
@@ -16,54 +20,153 @@ def get_mutation_ids_for_mutation_group(mutation_group):
 
 def get_mutation_ids_for_json_node(node):
     assert "mutationGroups" in node
-    return functools.reduce(lambda x, y: x + y, map(get_mutation_ids_for_mutation_group, node["mutationGroups"]), [])
+    result = []
+    for mutation_group in node["mutationGroups"]:
+        result.extend(get_mutation_ids_for_mutation_group(mutation_group))
+    return result
 
 
-class MutationTreeNode:
-    def __init__(self, mutation_ids, children):
-        self.children = children
-        self.mutation_ids = mutation_ids
+def compute_structural_fingerprint(parent, node_mutations_start, mutation_ids) -> bytes:
+    # Computes a hash of the shape of a mutation tree and of the ids of the mutations at each of its nodes. Two trees
+    # have the same fingerprint if (barring hash collisions) and only if they have the same nodes, in the same
+    # preorder, with the same mutation ids; the remaining arrays of a tree are determined by these three. The hash is
+    # taken over the little-endian representation of the arrays, so that it is stable across platforms.
+    fingerprint = hashlib.blake2b(digest_size=FINGERPRINT_SIZE)
+    for values in [parent, node_mutations_start, mutation_ids]:
+        fingerprint.update(len(values).to_bytes(8, 'little'))
+        if sys.byteorder == 'little':
+            fingerprint.update(values)
+        else:
+            values_little_endian = array('q', values)
+            values_little_endian.byteswap()
+            fingerprint.update(values_little_endian)
+    return fingerprint.digest()
+
+
+class MutationTreeBuilder:
+    # Accumulates the nodes of a mutation tree as they are discovered. Nodes must be added in depth-first preorder, i.e.
+    # a node must be added after its parent and before any node that follows it in a traversal of the tree. The
+    # mutation ids of a node may be added at any time after the node itself, which allows a node's mutation ids to
+    # appear after its children when the tree is read as a stream.
+    def __init__(self):
+        self.parent: array = array('q')
+        # The node and the id of each mutation, in the order in which mutations were added.
+        self.mutation_node_ids: array = array('q')
+        self.mutation_ids: array = array('q')
+
+    def add_node(self, parent_node_id: int) -> int:
+        assert -1 <= parent_node_id < len(self.parent)
+        self.parent.append(parent_node_id)
+        return len(self.parent) - 1
+
+    def add_mutation_ids(self, node_id: int, mutation_ids: List[int]) -> None:
+        assert 0 <= node_id < len(self.parent)
+        for mutation_id in mutation_ids:
+            self.mutation_node_ids.append(node_id)
+            self.mutation_ids.append(mutation_id)
+
+    def add_json_node(self, json_node, parent_node_id: int) -> None:
+        # Adds a JSON mutation tree node and all of its descendants. This uses an explicit stack rather than recursion,
+        # as mutation trees for large source files can be too deep to traverse recursively.
+        stack = [(json_node, parent_node_id)]
+        while stack:
+            json_node, parent_node_id = stack.pop()
+            node_id = self.add_node(parent_node_id)
+            self.add_mutation_ids(node_id, get_mutation_ids_for_json_node(json_node))
+            for child_json_node in reversed(json_node["children"]):
+                stack.append((child_json_node, node_id))
+
+    def build(self) -> 'MutationTree':
+        return MutationTree.from_arrays(*self.build_arrays())
+
+    def build_arrays(self) -> Tuple[array, array, array, array, array]:
+        # Returns the arrays parent, subtree_end, node_mutations_start, mutation_ids and mutation_id_to_node_id that
+        # represent the tree; see MutationTree.
+        num_nodes: int = len(self.parent)
+
+        # Group the mutation ids by node (preserving the order in which each node's ids were added), using a counting
+        # sort.
+        node_mutations_start = array('q', [0]) * (num_nodes + 1)
+        for node_id in self.mutation_node_ids:
+            node_mutations_start[node_id + 1] += 1
+        for node_id in range(num_nodes):
+            node_mutations_start[node_id + 1] += node_mutations_start[node_id]
+        next_position = node_mutations_start[:-1]
+        mutation_ids = array('q', [0]) * len(self.mutation_ids)
+        for node_id, mutation_id in zip(self.mutation_node_ids, self.mutation_ids):
+            mutation_ids[next_position[node_id]] = mutation_id
+            next_position[node_id] += 1
+
+        # Every node of a subtree is numbered after the subtree's root, so subtree sizes can be accumulated in a single
+        # pass over the nodes in reverse order.
+        subtree_size = array('q', [1]) * num_nodes
+        for node_id in range(num_nodes - 1, -1, -1):
+            if self.parent[node_id] >= 0:
+                subtree_size[self.parent[node_id]] += subtree_size[node_id]
+        subtree_end = array('q', [node_id + subtree_size[node_id] for node_id in range(num_nodes)])
+
+        # Mutation ids start from 0, so the number of mutations is one more than the largest id.
+        mutation_id_to_node_id = array('q', [-1]) * (max(mutation_ids, default=-1) + 1)
+        for node_id, mutation_id in zip(self.mutation_node_ids, self.mutation_ids):
+            mutation_id_to_node_id[mutation_id] = node_id
+
+        return self.parent, subtree_end, node_mutations_start, mutation_ids, mutation_id_to_node_id
 
 
 class MutationTree:
+    # The nodes of the tree (a forest, with one root per mutated file) are numbered in depth-first preorder, so that the
+    # descendants of node n are exactly the nodes numbered n + 1 up to (but excluding) subtree_end[n]. The mutation ids
+    # of all nodes are stored consecutively, in node order, in a single flat array; the ids for node n are at positions
+    # node_mutations_start[n] up to node_mutations_start[n + 1]. Consequently, the mutation ids for the subtree rooted
+    # at n occupy one contiguous range of the flat array.
+    #
+    # The arrays are of type 'q' (signed 64-bit) so that they can be saved and mapped back into memory directly; see
+    # mutation_tree_cache.py.
+    #
+    # The tree's structural fingerprint (see compute_structural_fingerprint) allows trees to be compared cheaply.
     def __init__(self, json_data):
+        builder = MutationTreeBuilder()
+        for file in json_data["infoForFiles"]:
+            builder.add_json_node(file["mutationTreeRoot"], -1)
+        self._set_arrays(*builder.build_arrays())
 
-        def populate(json_node, node_id):
-            children = []
-            for child_json_node in json_node["children"]:
-                child_node_id = self.num_nodes
-                children.append(child_node_id)
-                self.parent_map[child_node_id] = node_id
-                self.num_nodes += 1
-                populate(child_json_node, child_node_id)
-            self.nodes[node_id] = MutationTreeNode(get_mutation_ids_for_json_node(json_node), children)
-            temp: int = functools.reduce(max, self.nodes[node_id].mutation_ids, 0)
-            self.num_mutations = max(self.num_mutations, temp)
-            for mutation_id in self.nodes[node_id].mutation_ids:
-                self.mutation_id_to_node_id[mutation_id] = node_id
-
-        self.nodes = {}
-        self.parent_map = {}
-        self.mutation_id_to_node_id = {}
-        self.num_mutations = 0
-        self.num_nodes = 0
-
-        for root_json_node in [file["mutationTreeRoot"] for file in json_data["infoForFiles"]]:
-            root_node_id = self.num_nodes
-            self.num_nodes += 1
-            populate(root_json_node, root_node_id)
+    @classmethod
+    def from_arrays(cls, parent, subtree_end, node_mutations_start, mutation_ids, mutation_id_to_node_id,
+                    fingerprint: Optional[bytes] = None):
+        # Creates a tree directly from its arrays, which may be any sequences of 64-bit integers supporting slicing,
+        # 'tolist' and the buffer protocol, such as memoryviews of a memory-mapped file. If the tree's fingerprint is
+        # already known it can be supplied, to save recomputing it.
+        tree = cls.__new__(cls)
+        tree._set_arrays(parent, subtree_end, node_mutations_start, mutation_ids, mutation_id_to_node_id, fingerprint)
+        return tree
+
+    def _set_arrays(self, parent, subtree_end, node_mutations_start, mutation_ids, mutation_id_to_node_id,
+                    fingerprint: Optional[bytes] = None):
+        self.parent = parent
+        self.subtree_end = subtree_end
+        self.node_mutations_start = node_mutations_start
+        self.mutation_ids = mutation_ids
+        self.mutation_id_to_node_id = mutation_id_to_node_id
+        self.num_nodes: int = len(parent)
+        self.num_mutations: int = len(mutation_id_to_node_id)
+        self.fingerprint: bytes = compute_structural_fingerprint(parent, node_mutations_start, mutation_ids)\
+            if fingerprint is None else fingerprint
+
+    def get_mutation_ids_for_node(self, node_id) -> List[int]:
+        assert 0 <= node_id < self.num_nodes
+        return self.mutation_ids[self.node_mutations_start[node_id]:self.node_mutations_start[node_id + 1]].tolist()
 
     def get_mutation_ids_for_subtree(self, node_id) -> List[int]:
         assert 0 <= node_id < self.num_nodes
-        return self.nodes[node_id].mutation_ids + functools.reduce(lambda x, y: x + y,
-                                                                   map(lambda x: self.get_mutation_ids_for_subtree(x),
-                                                                       self.nodes[node_id].children), [])
+        return self.mutation_ids[self.node_mutations_start[node_id]:
+                                 self.node_mutations_start[self.subtree_end[node_id]]].tolist()
 
     def get_incompatible_mutation_ids(self, mutation_id) -> List[int]:
         assert 0 <= mutation_id < self.num_mutations
         node_id = self.mutation_id_to_node_id[mutation_id]
         result = self.get_mutation_ids_for_subtree(node_id)
-        while node_id in self.parent_map:
-            node_id = self.parent_map[node_id]
-            result += self.nodes[node_id].mutation_ids
+        node_id = self.parent[node_id]
+        while node_id >= 0:
+            result += self.get_mutation_ids_for_node(node_id)
+            node_id = self.parent[node_id]
         return result
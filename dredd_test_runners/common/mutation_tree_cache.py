@@ -0,0 +1,174 @@
+import argparse
+import hashlib
+import mmap
+import os
+import struct
+import tempfile
+
+from dredd_test_runners.common.hash_file import hash_file
+from dredd_test_runners.common.mutation_info_stream import read_mutation_tree_from_file
+from dredd_test_runners.common.mutation_tree import FINGERPRINT_SIZE, MutationTree
+
+from array import array
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+# A cached mutation tree is a header followed by the tree's arrays, each a sequence of native signed 64-bit integers:
+# parent, subtree_end, node_mutations_start, mutation_ids and mutation_id_to_node_id. Loading a cached tree maps the
+# file into memory and views the arrays in place, so that processes using the same cached tree share its pages.
+CACHE_MAGIC: bytes = b'DREDDMT\0'
+CACHE_FORMAT_VERSION: int = 2
+# Magic, version, number of nodes, number of mutation ids, number of mutations, structural fingerprint.
+CACHE_HEADER_FORMAT: str = f'=8sqqqq{FINGERPRINT_SIZE}s'
+CACHE_HEADER_SIZE: int = struct.calcsize(CACHE_HEADER_FORMAT)
+CACHE_WORD_SIZE: int = 8
+
+DEFAULT_MUTATION_TREE_CACHE_DIR: Path = Path(os.environ.get("XDG_CACHE_HOME", Path.home() / ".cache"))\
+    / "dredd_test_runners" / "mutation_trees"
+
+
+def save_mutation_tree(mutation_tree: MutationTree, cache_file: Path) -> None:
+    cache_file.parent.mkdir(parents=True, exist_ok=True)
+    # Write to a temporary file and rename it into place, so that a concurrently running process never sees a partially
+    # written cache file.
+    file_descriptor, temp_path = tempfile.mkstemp(dir=cache_file.parent, prefix='.' + cache_file.name)
+    try:
+        with os.fdopen(file_descriptor, 'wb') as outfile:
+            outfile.write(struct.pack(CACHE_HEADER_FORMAT,
+                                      CACHE_MAGIC,
+                                      CACHE_FORMAT_VERSION,
+                                      mutation_tree.num_nodes,
+                                      len(mutation_tree.mutation_ids),
+                                      mutation_tree.num_mutations,
+                                      mutation_tree.fingerprint))
+            for values in [mutation_tree.parent,
+                           mutation_tree.subtree_end,
+                           mutation_tree.node_mutations_start,
+                           mutation_tree.mutation_ids,
+                           mutation_tree.mutation_id_to_node_id]:
+                array('q', values).tofile(outfile)
+        os.replace(temp_path, cache_file)
+    except BaseException:
+        os.remove(temp_path)
+        raise
+
+
+def _read_header(header: bytes, file_size: int) -> Optional[Tuple[List[int], bytes]]:
+    # Returns the lengths of the arrays of a cached tree, and the tree's fingerprint, or None if the header is not that
+    # of a valid cached tree of the given file size.
+    if len(header) < CACHE_HEADER_SIZE:
+        return None
+    magic, version, num_nodes, num_mutation_ids, num_mutations, fingerprint = \
+        struct.unpack_from(CACHE_HEADER_FORMAT, header)
+    lengths = [num_nodes, num_nodes, num_nodes + 1, num_mutation_ids, num_mutations]
+    if magic != CACHE_MAGIC or version != CACHE_FORMAT_VERSION \
+            or file_size != CACHE_HEADER_SIZE + CACHE_WORD_SIZE * sum(lengths):
+        return None
+    return lengths, fingerprint
+
+
+def read_mutation_tree_fingerprint(cache_file: Path) -> Optional[bytes]:
+    # Reads just the fingerprint of a cached mutation tree. Returns None if the file is not a valid cached mutation
+    # tree.
+    with open(cache_file, 'rb') as infile:
+        header = _read_header(infile.read(CACHE_HEADER_SIZE), os.fstat(infile.fileno()).st_size)
+    return None if header is None else header[1]
+
+
+def read_mutation_tree(cache_file: Path) -> Optional[MutationTree]:
+    # Returns None if the file is not a valid cached mutation tree, e.g. if it was written by an incompatible version
+    # of this code.
+    with open(cache_file, 'rb') as infile:
+        if os.fstat(infile.fileno()).st_size < CACHE_HEADER_SIZE:
+            return None
+        mapped = mmap.mmap(infile.fileno(), 0, access=mmap.ACCESS_READ)
+    header = _read_header(mapped[:CACHE_HEADER_SIZE], len(mapped))
+    if header is None:
+        mapped.close()
+        return None
+    lengths, fingerprint = header
+    words = memoryview(mapped)[CACHE_HEADER_SIZE:].cast('q')
+    arrays = []
+    offset = 0
+    for length in lengths:
+        arrays.append(words[offset:offset + length])
+        offset += length
+    return MutationTree.from_arrays(*arrays, fingerprint=fingerprint)
+
+
+def _content_hash(mutation_info_file: Path, cache_dir: Path) -> str:
+    # Hashing a multi-hundred-megabyte file takes a while, so the hash is remembered for as long as the file's path,
+    # size and modification time are unchanged.
+    file_stat = os.stat(mutation_info_file)
+    stat_key: str = hashlib.md5(
+        f"{mutation_info_file.resolve()}:{file_stat.st_size}:{file_stat.st_mtime_ns}".encode('utf-8')).hexdigest()
+    stat_key_file: Path = cache_dir / "content_hashes" / stat_key
+    if stat_key_file.exists():
+        return stat_key_file.read_text().strip()
+    content_hash: str = hash_file(str(mutation_info_file))
+    stat_key_file.parent.mkdir(parents=True, exist_ok=True)
+    temp_file: Path = stat_key_file.with_name(f"{stat_key}.{os.getpid()}.tmp")
+    temp_file.write_text(content_hash)
+    os.replace(temp_file, stat_key_file)
+    return content_hash
+
+
+def _cache_file(mutation_info_file: Path, cache_dir: Path) -> Path:
+    return cache_dir / (_content_hash(mutation_info_file, cache_dir) + ".mtree")
+
+
+def load_mutation_tree(mutation_info_file: Path, cache_dir: Optional[Path]) -> MutationTree:
+    # Loads the mutation tree described by the given Dredd mutation info file, from a cache in 'cache_dir' if the file
+    # has been loaded before; otherwise, the tree is built from the file and added to the cache. The cache is keyed by
+    # a hash of the file's contents. If 'cache_dir' is None, no cache is used.
+    if cache_dir is None:
+        return read_mutation_tree_from_file(mutation_info_file)
+    cache_file: Path = _cache_file(mutation_info_file, cache_dir)
+    if cache_file.exists():
+        cached_tree: Optional[MutationTree] = read_mutation_tree(cache_file)
+        if cached_tree is not None:
+            print(f"Loaded cached mutation tree {cache_file}")
+            return cached_tree
+    mutation_tree: MutationTree = read_mutation_tree_from_file(mutation_info_file)
+    save_mutation_tree(mutation_tree, cache_file)
+    print(f"Saved mutation tree to cache {cache_file}")
+    return mutation_tree
+
+
+def load_mutation_tree_fingerprint(mutation_info_file: Path, cache_dir: Optional[Path]) -> bytes:
+    # Determines the fingerprint of the mutation tree described by the given Dredd mutation info file. If the tree is
+    # cached, only the cached file's header is read.
+    if cache_dir is not None:
+        cache_file: Path = _cache_file(mutation_info_file, cache_dir)
+        if cache_file.exists():
+            fingerprint: Optional[bytes] = read_mutation_tree_fingerprint(cache_file)
+            if fingerprint is not None:
+                return fingerprint
+    return load_mutation_tree(mutation_info_file, cache_dir).fingerprint
+
+
+def load_checked_mutation_tree(mutation_info_file: Path,
+                               mutation_info_file_for_mutant_coverage_tracking: Path,
+                               cache_dir: Optional[Path]) -> MutationTree:
+    # Loads the mutation tree for the mutated compiler, checking that it matches the tree for the mutant coverage
+    # tracking compiler, as it must for coverage information obtained from the latter to be meaningful for the former.
+    # The check compares structural fingerprints, so the tree for the mutant coverage tracking compiler is only built
+    # if it is not already cached, and is never kept in memory.
+    print("Building the real mutation tree...")
+    mutation_tree: MutationTree = load_mutation_tree(mutation_info_file, cache_dir)
+    print("Built!")
+    print("Checking that the mutation tree associated with mutant coverage tracking matches...")
+    assert mutation_tree.fingerprint == load_mutation_tree_fingerprint(mutation_info_file_for_mutant_coverage_tracking,
+                                                                       cache_dir)
+    print("Check complete!")
+    return mutation_tree
+
+
+def add_mutation_tree_cache_argument(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument("--mutation_tree_cache_dir",
+                        default=DEFAULT_MUTATION_TREE_CACHE_DIR,
+                        help="Directory in which to cache mutation trees in a compact binary form, keyed by a hash of "
+                             "the mutation info file they were built from, so that subsequent runs can load them "
+                             "almost instantly. Pass an empty string to disable caching. Default is "
+                             f"{DEFAULT_MUTATION_TREE_CACHE_DIR}.",
+                        type=lambda value: Path(value) if value else None)
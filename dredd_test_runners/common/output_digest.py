@@ -0,0 +1,62 @@
+import argparse
+import hashlib
+
+from typing import Dict, Optional
+
+# The number of bytes kept from each end of an output stream that is digested.
+OUTPUT_EXCERPT_SIZE: int = 4096
+
+
+def add_bounded_output_capture_argument(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument("--bounded_output_capture",
+                        action="store_true",
+                        help="Rather than keeping all the output of each run of a test program, with and without "
+                             "mutants, keep only its length, a hash of it and a few kilobytes from each end of it, so "
+                             "that the memory used does not depend on how much output tests produce. Outputs are "
+                             "still compared exactly, via their hashes.")
+
+
+class OutputDigest:
+    # A record of an output stream whose size does not depend on the amount of output: the length of the output, a hash
+    # of it, and an excerpt from each end of it. Two records are equal if the outputs they record have the same length
+    # and hash, so comparing them takes constant time. The excerpts are kept for diagnostics, and so that output that
+    # is still being produced can be checked against the start of the recorded output.
+    def __init__(self):
+        self._md5_hash = hashlib.md5()
+        self._digest: Optional[str] = None
+        self._length: int = 0
+        self.prefix: bytearray = bytearray()
+        self.suffix: bytearray = bytearray()
+
+    def extend(self, data: bytes) -> None:
+        self._md5_hash.update(data)
+        self._length += len(data)
+        if len(self.prefix) < OUTPUT_EXCERPT_SIZE:
+            self.prefix += data[:OUTPUT_EXCERPT_SIZE - len(self.prefix)]
+        self.suffix += data[-OUTPUT_EXCERPT_SIZE:]
+        del self.suffix[:-OUTPUT_EXCERPT_SIZE]
+
+    def digest(self) -> str:
+        return self._md5_hash.hexdigest() if self._md5_hash is not None else self._digest
+
+    # Hash objects cannot be pickled, e.g. to pass a vetted program from one worker to another, so a pickled record
+    # keeps the digest of the output instead, and cannot be extended.
+    def __getstate__(self) -> Dict:
+        state: Dict = self.__dict__.copy()
+        state['_digest'] = self.digest()
+        state['_md5_hash'] = None
+        return state
+
+    def __len__(self) -> int:
+        return self._length
+
+    def __eq__(self, other) -> bool:
+        return isinstance(other, OutputDigest) and len(self) == len(other) and self.digest() == other.digest()
+
+    # Whether the data occurs in one of the excerpts. Data elsewhere in the output is not found.
+    def __contains__(self, data: bytes) -> bool:
+        return data in self.prefix or data in self.suffix
+
+    def __str__(self) -> str:
+        return f"{len(self)} bytes with MD5 hash {self.digest()}, starting {bytes(self.prefix)!r} and ending " \
+               f"{bytes(self.suffix)!r}"
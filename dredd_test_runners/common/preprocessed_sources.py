@@ -0,0 +1,77 @@
+import argparse
+import os
+
+from dredd_test_runners.common.run_process_with_timeout import ProcessResult, run_process_with_timeout
+from dredd_test_runners.common.two_stage_build import is_source_file
+
+from pathlib import Path
+from typing import Dict, List, Optional, Set
+
+# The extension that a preprocessed source file gets, keyed by the extension of the original source file.
+PREPROCESSED_EXTENSIONS: Dict[str, str] = {'.c': '.i', '.cc': '.ii', '.cpp': '.ii', '.cxx': '.ii'}
+
+PREPROCESSED_SOURCE_PREFIX: str = "__preprocessed_"
+
+
+def add_preprocess_once_argument(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument("--preprocess_once",
+                        action="store_true",
+                        help="Preprocess each program once, using the compiler without mutants, and compile mutants "
+                             "from the preprocessed source. Mutants that are reached while preprocessing are still "
+                             "compiled from the original source, as they might change its preprocessed form.")
+
+
+class PreprocessedSources:
+    # The source files of a test, preprocessed once so that mutant compilations need not repeat the work of
+    # preprocessing them, which for a Csmith program includes reading the Csmith runtime headers. Other compiler
+    # arguments are kept, even those that only affect preprocessing, as compilers ignore them when compiling
+    # preprocessed source.
+    #
+    # A mutant that is reached during preprocessing might change the result of preprocessing, so builds with such a
+    # mutant enabled must use the original source files.
+    def __init__(self, compiler_args: List[str], output_dir: Path):
+        self.original_compiler_args: List[str] = compiler_args
+        self.sources: List[str] = [arg for arg in compiler_args if is_source_file(arg)]
+        self.preprocessed_sources: List[str] = [
+            str(output_dir / f"{PREPROCESSED_SOURCE_PREFIX}{index}_{Path(source).stem}"
+                             f"{PREPROCESSED_EXTENSIONS[os.path.splitext(source)[1]]}")
+            for index, source in enumerate(self.sources)]
+        preprocessed_source_for: Dict[str, str] = dict(zip(self.sources, self.preprocessed_sources))
+        self.compiler_args: List[str] = [preprocessed_source_for.get(arg, arg) for arg in compiler_args]
+        self._flags: List[str] = [arg for arg in compiler_args if not is_source_file(arg)]
+        self._output_dir: Path = output_dir
+        # The mutants reached while preprocessing, once tracked.
+        self.covered_mutants: Set[int] = set()
+
+    # Preprocesses each source file. Returns None if preprocessing timed out; otherwise the result of the first
+    # preprocessing step that failed, or of the last one if all succeeded.
+    def preprocess(self, compiler_path: str, timeout_seconds: int) -> Optional[ProcessResult]:
+        result: Optional[ProcessResult] = None
+        for source, preprocessed_source in zip(self.sources, self.preprocessed_sources):
+            result = run_process_with_timeout(cmd=[compiler_path] + self._flags + ['-E', source,
+                                                                                   '-o', preprocessed_source],
+                                              timeout_seconds=timeout_seconds)
+            if result is None or result.returncode != 0:
+                return result
+        return result
+
+    # Records the mutants that are reached while preprocessing. Returns False if preprocessing timed out.
+    def track_coverage(self, tracking_compiler_path: str, timeout_seconds: int) -> bool:
+        covered_mutants_path: Path = self._output_dir / f"{PREPROCESSED_SOURCE_PREFIX}covered_mutants"
+        if covered_mutants_path.exists():
+            os.remove(covered_mutants_path)
+        tracking_environment = os.environ.copy()
+        tracking_environment["DREDD_MUTANT_TRACKING_FILE"] = str(covered_mutants_path)
+        for source in self.sources:
+            if run_process_with_timeout(cmd=[tracking_compiler_path] + self._flags + ['-E', source,
+                                                                                     '-o', os.devnull],
+                                        timeout_seconds=timeout_seconds,
+                                        env=tracking_environment) is None:
+                return False
+        # The tracking file is only written if some mutant is covered.
+        self.covered_mutants = set([int(line.strip()) for line in open(covered_mutants_path, 'r')])\
+            if covered_mutants_path.exists() else set()
+        return True
+
+    def affected_by(self, mutants: List[int]) -> bool:
+        return any(mutant in self.covered_mutants for mutant in mutants)
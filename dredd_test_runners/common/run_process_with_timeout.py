@@ -1,32 +1,322 @@
+import asyncio
+import math
 import os
+import resource
 import signal
 import subprocess
 
+from dredd_test_runners.common.output_digest import OutputDigest
+
 from pathlib import Path
-from typing import AnyStr, Dict, List, Optional
+from typing import AnyStr, Callable, Dict, List, Optional, Tuple, Union
+
+# Time in seconds that a timed-out process group is given to exit after SIGTERM, before it is sent SIGKILL.
+PROCESS_TERMINATION_GRACE_PERIOD: float = 1.0
+
+# A process that exceeds its memory limit fails to allocate memory, which it typically reports with an error message or
+# by crashing. Only failures reporting one of these messages are recognised as exceeding the limit; a process that
+# crashes, or reports the failure in some other way, is not. In addition, if the runner's cgroup (v2) counts a process
+# being killed by the kernel's out-of-memory killer while a process runs, and that process was killed by SIGKILL, it is
+# considered to have run out of memory.
+OUT_OF_MEMORY_MESSAGES: List[bytes] = [b"out of memory", b"Out of memory", b"std::bad_alloc", b"Cannot allocate memory",
+                                       b"memory exhausted", b"MemoryError"]
+
+# The maximum number of bytes read from a process's output at a time.
+PIPE_READ_SIZE: int = 65536
+
+
+# The output of a process: either all of it, or a digest of it.
+CapturedOutput = Union[bytes, OutputDigest]
 
 
 class ProcessResult:
-    def __init__(self, returncode: int, stdout: bytes, stderr: bytes):
+    def __init__(self,
+                 returncode: int,
+                 stdout: CapturedOutput,
+                 stderr: CapturedOutput,
+                 cpu_time: float = 0.0,
+                 max_rss: int = 0):
         self.returncode: int = returncode
-        self.stdout: bytes = stdout
-        self.stderr: bytes = stderr
+        self.stdout: CapturedOutput = stdout
+        self.stderr: CapturedOutput = stderr
+        # User plus system CPU time in seconds, and maximum resident set size in kilobytes, of the process and of any
+        # processes it started and waited for.
+        self.cpu_time: float = cpu_time
+        self.max_rss: int = max_rss
+        # Whether the process failed because it exceeded its memory limit.
+        self.memory_limit_exceeded: bool = False
+        # Whether the process was stopped because its standard output or error diverged from the expected output, in
+        # which case the output only goes as far as the point of divergence.
+        self.stdout_diverged: bool = False
+        self.stderr_diverged: bool = False
 
+    def add_resource_usage(self, other: 'ProcessResult') -> None:
+        # Accounts for the resources used by another process, e.g. an earlier step of the same build.
+        self.cpu_time += other.cpu_time
+        self.max_rss = max(self.max_rss, other.max_rss)
 
-def run_process_with_timeout(cmd: List[str],
-                             timeout_seconds: int,
-                             env: Optional[Dict[AnyStr, AnyStr]] = None,
-                             cwd: Path = None) -> Optional[ProcessResult]:
-    process = None
+
+def _signal_process_group(process: subprocess.Popen, signum: int) -> None:
+    # The process leads its own process group (it runs in its own session), so this signals the process and everything
+    # it has started, such as the jobs run by a compiler driver.
+    try:
+        os.killpg(process.pid, signum)
+    except ProcessLookupError:
+        pass
+
+
+async def _wait4(pid: int) -> Tuple[int, resource.struct_rusage]:
+    # Waits for the process to exit and reaps it, returning its wait status and resource usage. Where possible, exit is
+    # detected using a pidfd, which needs no thread.
+    loop = asyncio.get_running_loop()
+    try:
+        pidfd: int = os.pidfd_open(pid)
+    except (AttributeError, OSError):
+        _, status, rusage = await loop.run_in_executor(None, os.wait4, pid, 0)
+        return status, rusage
+    exited: asyncio.Future = loop.create_future()
+    loop.add_reader(pidfd, lambda: exited.done() or exited.set_result(None))
+    try:
+        await exited
+    finally:
+        loop.remove_reader(pidfd)
+        os.close(pidfd)
+    _, status, rusage = os.wait4(pid, 0)
+    return status, rusage
+
+
+class _OutputDiverged(Exception):
+    pass
+
+
+def _diverges(expected: CapturedOutput, output_length: int, chunk: bytes) -> bool:
+    # Whether output that has just been extended with 'chunk', to 'output_length' bytes, is no longer a prefix of the
+    # expected output. Only the start of a digested output is known, so beyond that only its length is checked.
+    if output_length > len(expected):
+        return True
+    known_output: bytes = expected if isinstance(expected, bytes) else expected.prefix
+    chunk_start: int = output_length - len(chunk)
+    return known_output[chunk_start:output_length] != chunk[:max(0, len(known_output) - chunk_start)]
+
+
+def _captured(output: Union[bytearray, OutputDigest]) -> CapturedOutput:
+    return bytes(output) if isinstance(output, bytearray) else output
+
+
+async def _read_pipe(pipe, output: Union[bytearray, OutputDigest], expected: Optional[CapturedOutput]) -> None:
+    # Reads from the pipe into 'output' until end of file. If 'expected' is given, raises _OutputDiverged as soon as
+    # the output read so far is not a prefix of it. Output is accumulated in 'output', rather than returned, so that
+    # it is available even if reading is cancelled.
+    loop = asyncio.get_running_loop()
+    reader = asyncio.StreamReader()
+    transport, _ = await loop.connect_read_pipe(lambda: asyncio.StreamReaderProtocol(reader), pipe)
+    try:
+        while True:
+            chunk: bytes = await reader.read(PIPE_READ_SIZE)
+            if not chunk:
+                return
+            output.extend(chunk)
+            if expected is not None and _diverges(expected, len(output), chunk):
+                raise _OutputDiverged()
+    finally:
+        transport.close()
+
+
+def _diverged(reading: asyncio.Task) -> bool:
+    return reading.done() and not reading.cancelled() and isinstance(reading.exception(), _OutputDiverged)
+
+
+async def _cancel(tasks: List[asyncio.Task]) -> None:
+    for task in tasks:
+        task.cancel()
+    if tasks:
+        await asyncio.wait(tasks)
+
+
+async def _reap(process: subprocess.Popen, exit_status: asyncio.Task) -> None:
+    status, _ = await exit_status
+    process.returncode = os.waitstatus_to_exitcode(status)
+
+
+async def _terminate_process_group(process: subprocess.Popen, exit_status: asyncio.Task) -> None:
+    # Asks the process group to exit, and kills it if the process has not exited after a grace period. The group is
+    # killed even if the process exits in time, in case other processes in the group ignored SIGTERM. This is safe
+    # because a process group's id cannot be reused while any process is still in the group.
+    _signal_process_group(process, signal.SIGTERM)
+    await asyncio.wait([exit_status], timeout=PROCESS_TERMINATION_GRACE_PERIOD)
+    _signal_process_group(process, signal.SIGKILL)
+    await _reap(process, exit_status)
+
+
+def _resource_limiter(cpu_time_limit: Optional[int], memory_limit_bytes: Optional[int]) -> Optional[Callable[[], None]]:
+    # Returns a function that sets the given resource limits, to be run in a child process between fork and exec, or
+    # None if there are no limits to set. This is safe because the function only makes system calls, and the processes
+    # that run commands are single-threaded apart from any queue feeder threads, which hold no locks that it needs.
+    if cpu_time_limit is None and memory_limit_bytes is None:
+        return None
+
+    def set_limits() -> None:
+        if cpu_time_limit is not None:
+            resource.setrlimit(resource.RLIMIT_CPU, (cpu_time_limit, cpu_time_limit + 1))
+        if memory_limit_bytes is not None:
+            resource.setrlimit(resource.RLIMIT_AS, (memory_limit_bytes, memory_limit_bytes))
+    return set_limits
+
+
+def _cgroup_memory_events_path() -> Optional[Path]:
+    # The memory.events file of the cgroup (v2) that this process belongs to, if there is one.
+    try:
+        with open("/proc/self/mounts") as mounts:
+            mount_points: List[str] = [line.split()[1] for line in mounts if line.split()[2] == "cgroup2"]
+        with open("/proc/self/cgroup") as cgroups:
+            cgroup: List[str] = [line.rstrip("\n")[len("0::"):] for line in cgroups if line.startswith("0::")]
+    except OSError:
+        return None
+    if not mount_points or not cgroup:
+        return None
+    path: Path = Path(mount_points[0]) / cgroup[0].lstrip("/") / "memory.events"
+    return path if path.exists() else None
+
+
+def _cgroup_oom_kill_count(memory_events_path: Optional[Path]) -> Optional[int]:
+    if memory_events_path is None:
+        return None
     try:
-        process = subprocess.Popen(cmd,
-                                   start_new_session=True,
-                                   stdout=subprocess.PIPE,
-                                   stderr=subprocess.PIPE,
-                                   env=env,
-                                   cwd=cwd)
-        process_stdout, process_stderr = process.communicate(timeout=timeout_seconds)
-        return ProcessResult(returncode=process.returncode, stdout=process_stdout, stderr=process_stderr)
-    except subprocess.TimeoutExpired:
-        os.killpg(os.getpgid(process.pid), signal.SIGTERM)
+        with open(memory_events_path) as memory_events:
+            for line in memory_events:
+                key, value = line.split()
+                if key == "oom_kill":
+                    return int(value)
+    except (OSError, ValueError):
+        pass
+    return None
+
+
+def _exceeded_memory_limit(result: ProcessResult,
+                           oom_kills_before: Optional[int],
+                           oom_kills_after: Optional[int]) -> bool:
+    if result.returncode == 0:
+        return False
+    if result.returncode == -signal.SIGKILL and oom_kills_before is not None and oom_kills_after is not None\
+            and oom_kills_after > oom_kills_before:
+        # Processes running concurrently share the cgroup, so this may misattribute another process's out-of-memory
+        # kill, but only to a process that was also killed without being asked to.
+        return True
+    return any(message in result.stderr for message in OUT_OF_MEMORY_MESSAGES)
+
+
+async def run_process_with_timeout_async(cmd: List[str],
+                                         timeout_seconds: float,
+                                         env: Optional[Dict[AnyStr, AnyStr]] = None,
+                                         cwd: Path = None,
+                                         cpu_time_limit_seconds: Optional[float] = None,
+                                         memory_limit_bytes: Optional[int] = None,
+                                         expected_output: Optional[ProcessResult] = None,
+                                         digest_output: bool = False) -> Optional[ProcessResult]:
+    # Runs a process, returning its result, or None if it did not finish within the timeout, in which case the process
+    # and any processes it started are terminated and reaped. Any number of processes can be run concurrently by
+    # awaiting several calls at once, e.g. using asyncio.gather.
+    #
+    # If 'cpu_time_limit_seconds' is given, the process (and each process it starts) is also limited to that much CPU
+    # time, rounded up to a whole number of seconds; exceeding it counts as timing out. Unlike wall-clock time, CPU time
+    # does not depend on how heavily loaded the machine is.
+    #
+    # If 'memory_limit_bytes' is given, the address space of the process (and of each process it starts) is limited to
+    # that many bytes, so that a process allocating without bound fails rather than exhausting the machine's memory;
+    # the result then records whether the process is known to have exceeded the limit (see OUT_OF_MEMORY_MESSAGES).
+    #
+    # If 'expected_output' is given, the process's standard output and error are compared with those of
+    # 'expected_output' as they are produced, and the process group is killed as soon as either diverges (i.e. differs
+    # or goes on for longer); the result then records which output diverged.
+    #
+    # If 'digest_output' is set, the result holds an OutputDigest of each output stream rather than all of its output,
+    # so that the memory needed does not grow with the amount of output.
+    #
+    # Both limits are resource limits that are set in the child before it runs the command, so that every process it
+    # starts (such as the jobs run by a compiler driver) inherits them.
+    cpu_time_limit: Optional[int] = None if cpu_time_limit_seconds is None else math.ceil(cpu_time_limit_seconds)
+    memory_events_path: Optional[Path] = None if memory_limit_bytes is None else _cgroup_memory_events_path()
+    oom_kills_before: Optional[int] = _cgroup_oom_kill_count(memory_events_path)
+    process = subprocess.Popen(cmd,
+                               start_new_session=True,
+                               stdout=subprocess.PIPE,
+                               stderr=subprocess.PIPE,
+                               env=env,
+                               cwd=cwd,
+                               preexec_fn=_resource_limiter(cpu_time_limit, memory_limit_bytes))
+    exit_status: asyncio.Task = asyncio.ensure_future(_wait4(process.pid))
+    stdout: Union[bytearray, OutputDigest] = OutputDigest() if digest_output else bytearray()
+    stderr: Union[bytearray, OutputDigest] = OutputDigest() if digest_output else bytearray()
+    output: List[asyncio.Task] = [
+        asyncio.ensure_future(_read_pipe(process.stdout, stdout,
+                                         None if expected_output is None else expected_output.stdout)),
+        asyncio.ensure_future(_read_pipe(process.stderr, stderr,
+                                         None if expected_output is None else expected_output.stderr))]
+    try:
+        done, _ = await asyncio.wait([exit_status] + output, timeout=timeout_seconds,
+                                     return_when=asyncio.ALL_COMPLETED if expected_output is None
+                                     else asyncio.FIRST_EXCEPTION)
+        if any(_diverged(reading) for reading in output):
+            # The process's behaviour is already known to differ, so there is no need to let it finish.
+            _signal_process_group(process, signal.SIGKILL)
+            await _cancel([reading for reading in output if not reading.done()])
+            await _reap(process, exit_status)
+            result = ProcessResult(returncode=process.returncode, stdout=_captured(stdout), stderr=_captured(stderr))
+            result.stdout_diverged = _diverged(output[0])
+            result.stderr_diverged = _diverged(output[1])
+            return result
+        for reading in output:
+            if reading in done and reading.exception() is not None:
+                # Reading stopped early for some reason other than divergence, e.g. a pipe error; the process is
+                # killed and reaped below, and the error propagated.
+                reading.result()
+        if exit_status not in done or any(reading not in done for reading in output):
+            # The process did not exit and close its outputs within the timeout.
+            await _cancel(output)
+            await _terminate_process_group(process, exit_status)
+            return None
+    except BaseException:
+        # The process runs in its own session, so it will not receive signals sent to this process's group (such as
+        # SIGINT from Ctrl-C). Make sure it does not outlive us if we are interrupted, cancelled or asked to exit.
+        _signal_process_group(process, signal.SIGKILL)
+        await _cancel(output)
+        await _reap(process, exit_status)
+        raise
+    status, rusage = exit_status.result()
+    process.returncode = os.waitstatus_to_exitcode(status)
+    for reading in output:
+        # Propagate any error that occurred while reading.
+        reading.result()
+    result = ProcessResult(returncode=process.returncode,
+                           stdout=_captured(stdout),
+                           stderr=_captured(stderr),
+                           cpu_time=rusage.ru_utime + rusage.ru_stime,
+                           max_rss=rusage.ru_maxrss)
+    # A process that exceeds its soft CPU time limit is sent SIGXCPU (and one that ignores this is killed on reaching
+    # the hard limit). A process that it started may instead report this as a failure, e.g. with an error message, so
+    # any failure of a process that used up the limit that was applied counts as exceeding it.
+    if cpu_time_limit is not None and result.returncode != 0 and (
+            result.returncode == -signal.SIGXCPU or result.cpu_time >= cpu_time_limit):
         return None
+    if memory_limit_bytes is not None:
+        result.memory_limit_exceeded = _exceeded_memory_limit(result, oom_kills_before,
+                                                              _cgroup_oom_kill_count(memory_events_path))
+    return result
+
+
+def run_process_with_timeout(cmd: List[str],
+                             timeout_seconds: float,
+                             env: Optional[Dict[AnyStr, AnyStr]] = None,
+                             cwd: Path = None,
+                             cpu_time_limit_seconds: Optional[float] = None,
+                             memory_limit_bytes: Optional[int] = None,
+                             expected_output: Optional[ProcessResult] = None,
+                             digest_output: bool = False) -> Optional[ProcessResult]:
+    return asyncio.run(run_process_with_timeout_async(cmd=cmd,
+                                                      timeout_seconds=timeout_seconds,
+                                                      env=env,
+                                                      cwd=cwd,
+                                                      cpu_time_limit_seconds=cpu_time_limit_seconds,
+                                                      memory_limit_bytes=memory_limit_bytes,
+                                                      expected_output=expected_output,
+                                                      digest_output=digest_output))
@@ -1,14 +1,21 @@
+import argparse
 from enum import Enum
 import os
 from pathlib import Path
-from typing import List
+from typing import Callable, Dict, List, Optional, Tuple
 
-from dredd_test_runners.common.constants import (MIN_TIMEOUT_FOR_MUTANT_COMPILATION,
-                                                 MIN_TIMEOUT_FOR_MUTANT_EXECUTION,
+from dredd_test_runners.common.constants import (MIN_RUNNER_TIMEOUT_FOR_MUTANT_COMPILATION,
+                                                 MIN_RUNNER_TIMEOUT_FOR_MUTANT_EXECUTION,
                                                  TIMEOUT_MULTIPLIER_FOR_MUTANT_COMPILATION,
-                                                 TIMEOUT_MULTIPLIER_FOR_MUTANT_EXECUTION)
+                                                 TIMEOUT_MULTIPLIER_FOR_MUTANT_EXECUTION,
+                                                 WALL_CLOCK_TIMEOUT_MULTIPLIER_FOR_CPU_TIME_LIMITS)
+from dredd_test_runners.common.driver_jobs import DriverJobCache
+from dredd_test_runners.common.hash_elf_sections import hash_elf_sections
 from dredd_test_runners.common.hash_file import hash_file
+from dredd_test_runners.common.output_digest import OutputDigest
+from dredd_test_runners.common.preprocessed_sources import PreprocessedSources
 from dredd_test_runners.common.run_process_with_timeout import ProcessResult, run_process_with_timeout
+from dredd_test_runners.common.two_stage_build import MUTANT_OBJECT_PREFIX, TwoStageBuild
 
 
 class KillStatus(Enum):
@@ -20,6 +27,135 @@ class KillStatus(Enum):
     KILL_DIFFERENT_EXIT_CODES = 6
     KILL_DIFFERENT_STDOUT = 7
     KILL_DIFFERENT_STDERR = 8
+    KILL_COMPILER_OUT_OF_MEMORY = 9
+    KILL_RUNTIME_OUT_OF_MEMORY = 10
+
+
+# Ways of hashing a binary, used to decide whether a mutant binary is equivalent to the unmutated binary, in which case
+# it need not be executed.
+BINARY_HASH_FUNCTIONS: Dict[str, Callable[[str], str]] = {
+    "whole_file": hash_file,
+    "elf_sections": hash_elf_sections,
+}
+
+
+def add_binary_comparison_argument(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument("--binary_comparison",
+                        default="whole_file",
+                        choices=list(BINARY_HASH_FUNCTIONS.keys()),
+                        help="How to decide whether a mutant binary is identical to the unmutated binary, in which "
+                             "case it is not executed. 'whole_file' compares entire files; 'elf_sections' compares "
+                             "only the entry point and the sections that are loaded when an ELF executable runs, "
+                             "ignoring e.g. build ids, symbol tables and debug information. Default is whole_file.")
+
+
+def add_cpu_time_limits_argument(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument("--cpu_time_limits",
+                        action="store_true",
+                        help="Measure the CPU time, rather than the wall-clock time, taken to compile and run each "
+                             "test without mutants, and limit the CPU time of mutant compilations and executions "
+                             "accordingly, so that whether a mutant times out does not depend on how heavily loaded "
+                             "the machine is. Wall-clock time is still limited, to a generous multiple of the CPU time "
+                             "limit.")
+
+
+def add_memory_limit_argument(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument("--memory_limit_mb",
+                        type=int,
+                        help="Limit the address space of each compiler and program process to this many megabytes, "
+                             "so that a mutant that makes the compiler or the compiled program allocate without bound "
+                             "fails, and is recorded as killed by running out of memory, instead of exhausting the "
+                             "machine's memory. Tests that exceed the limit without mutants are skipped. Default is no "
+                             "limit.")
+
+
+def add_streaming_output_comparison_argument(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument("--streaming_output_comparison",
+                        action="store_true",
+                        help="Compare the output of each mutant program with that of the unmutated program as it is "
+                             "produced, and kill the mutant program as soon as its output differs or goes on for "
+                             "longer, rather than waiting for it to finish or time out. A mutant killed in this way "
+                             "is recorded as killed by its standard output or standard error, even if its exit code "
+                             "would also have differed.")
+
+
+def memory_limit_bytes(memory_limit_mb: Optional[int]) -> Optional[int]:
+    return None if memory_limit_mb is None else memory_limit_mb * 1024 * 1024
+
+
+class MutantExecutionCache:
+    # Remembers the outcome of executing each distinct mutant binary produced for a test, keyed by the binary's hash.
+    # Different mutants often lead to the same binary (e.g. mutants of neighbouring parts of an expression that the
+    # compiler folds to the same result), and such binaries need only be executed once.
+    def __init__(self):
+        self._outcomes: Dict[str, KillStatus] = {}
+        self.hits: int = 0
+        self.misses: int = 0
+
+    def lookup(self, binary_hash: str) -> Optional[KillStatus]:
+        outcome: Optional[KillStatus] = self._outcomes.get(binary_hash)
+        if outcome is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return outcome
+
+    def add(self, binary_hash: str, outcome: KillStatus) -> None:
+        self._outcomes[binary_hash] = outcome
+
+    def __str__(self) -> str:
+        lookups: int = self.hits + self.misses
+        hit_rate: float = 100.0 * self.hits / lookups if lookups > 0 else 0.0
+        return f"{self.hits} of {lookups} mutant binaries were duplicates, and not executed ({hit_rate:.1f}%)"
+
+
+class TimeoutStatistics:
+    # Counts how often the mutant compilations and executions for a test time out. Frequent timeouts suggest that the
+    # test's time limits are too tight, or that its mutants often make the compiler or the program hang; either way,
+    # time is lost waiting for them.
+    def __init__(self, compile_time: float, run_time: float):
+        self._compilation_timeout: float = mutant_compilation_timeout(compile_time)
+        self._execution_timeout: float = mutant_execution_timeout(run_time)
+        self.runs: int = 0
+        self.compiler_timeouts: int = 0
+        self.runtime_timeouts: int = 0
+
+    def record(self, kill_status: KillStatus) -> None:
+        self.runs += 1
+        if kill_status == KillStatus.KILL_COMPILER_TIMEOUT:
+            self.compiler_timeouts += 1
+        elif kill_status == KillStatus.KILL_RUNTIME_TIMEOUT:
+            self.runtime_timeouts += 1
+
+    def __str__(self) -> str:
+        timeouts: int = self.compiler_timeouts + self.runtime_timeouts
+        timeout_rate: float = 100.0 * timeouts / self.runs if self.runs > 0 else 0.0
+        return f"{timeouts} of {self.runs} mutant runs timed out ({timeout_rate:.1f}%): {self.compiler_timeouts} " \
+               f"compilations (limit {self._compilation_timeout:.3f}s) and {self.runtime_timeouts} executions " \
+               f"(limit {self._execution_timeout:.3f}s)"
+
+
+def mutant_compilation_timeout(compile_time: float) -> float:
+    return max(MIN_RUNNER_TIMEOUT_FOR_MUTANT_COMPILATION, TIMEOUT_MULTIPLIER_FOR_MUTANT_COMPILATION * compile_time)
+
+
+def mutant_execution_timeout(run_time: float) -> float:
+    return max(MIN_RUNNER_TIMEOUT_FOR_MUTANT_EXECUTION, TIMEOUT_MULTIPLIER_FOR_MUTANT_EXECUTION * run_time)
+
+
+# Returns the wall-clock timeout and the CPU time limit (None if CPU time is not limited) to use for a process whose
+# time is limited to 'time_limit' seconds.
+def _process_time_limits(time_limit: float, cpu_time_limits: bool) -> Tuple[float, Optional[float]]:
+    if cpu_time_limits:
+        return WALL_CLOCK_TIMEOUT_MULTIPLIER_FOR_CPU_TIME_LIMITS * time_limit, time_limit
+    return time_limit, None
+
+
+# An upper bound on the (wall-clock) time that run_test_with_mutants may spend compiling and running, given the time
+# taken to compile and run the test without mutants.
+def mutant_test_time_limit(compile_time: float, run_time: float, cpu_time_limits: bool = False) -> float:
+    return _process_time_limits(mutant_compilation_timeout(compile_time), cpu_time_limits)[0]\
+        + _process_time_limits(mutant_execution_timeout(run_time), cpu_time_limits)[0]
 
 
 def run_test_with_mutants(mutants: List[int],
@@ -29,34 +165,137 @@ def run_test_with_mutants(mutants: List[int],
                           run_time: float,
                           binary_hash_non_mutated: str,
                           execution_result_non_mutated: ProcessResult,
-                          mutant_exe_path: Path) -> KillStatus:
+                          mutant_exe_path: Path,
+                          execution_cache: Optional[MutantExecutionCache] = None,
+                          hash_binary: Callable[[str], str] = hash_file,
+                          two_stage_build: Optional[TwoStageBuild] = None,
+                          preprocessed_sources: Optional[PreprocessedSources] = None,
+                          driver_jobs: Optional[DriverJobCache] = None,
+                          cpu_time_limits: bool = False,
+                          memory_limit: Optional[int] = None,
+                          streaming_output_comparison: bool = False) -> KillStatus:
+    # 'binary_hash_non_mutated' must have been computed using 'hash_binary'. If 'two_stage_build' is given, the mutant
+    # is built in two stages (see TwoStageBuild), whose unmutated build must be the one for 'binary_hash_non_mutated';
+    # otherwise the mutant is compiled and linked using 'compiler_args'.
+    #
+    # If 'preprocessed_sources' is given, the mutant is built from the preprocessed sources (which 'two_stage_build',
+    # if given, must use), unless one of the mutants is reached during preprocessing; 'compiler_args' are the original
+    # compiler arguments.
+    #
+    # If 'driver_jobs' is given, the compiler driver's jobs for building the mutant are run directly; see
+    # DriverJobCache.
+    #
+    # If 'cpu_time_limits' is set, 'compile_time' and 'run_time' are CPU times, and mutant compilation and execution
+    # are limited in CPU time rather than in wall-clock time.
+    #
+    # If 'memory_limit' is given, mutant compilation and execution are limited to that many bytes of address space.
+    #
+    # If 'streaming_output_comparison' is set, the mutant's output is compared with 'execution_result_non_mutated' as it
+    # is produced, and the mutant is stopped as soon as its output diverges.
+    compilation_timeout, compilation_cpu_time_limit = _process_time_limits(mutant_compilation_timeout(compile_time),
+                                                                           cpu_time_limits)
     mutated_environment = os.environ.copy()
     mutated_environment["DREDD_ENABLED_MUTATION"] = ','.join([str(m) for m in mutants])
-    if mutant_exe_path.exists():
-        os.remove(mutant_exe_path)
-    mutated_cmd = [compiler_path] + compiler_args + ['-o', str(mutant_exe_path)]
-    mutated_result: ProcessResult = run_process_with_timeout(
-        cmd=mutated_cmd,
-        timeout_seconds=int(max(
-            MIN_TIMEOUT_FOR_MUTANT_COMPILATION,
-            TIMEOUT_MULTIPLIER_FOR_MUTANT_COMPILATION * compile_time)),
-        env=mutated_environment)
+    original_sources: Optional[List[str]] = None
+    if preprocessed_sources is not None:
+        if preprocessed_sources.affected_by(mutants):
+            original_sources = preprocessed_sources.sources
+        else:
+            compiler_args = preprocessed_sources.compiler_args
+    if two_stage_build is not None:
+        recompiled_sources: List[int] = two_stage_build.sources_covering(mutants)
+        if not recompiled_sources:
+            return KillStatus.SURVIVED_IDENTICAL
+        mutated_result: ProcessResult = two_stage_build.compile(
+            compiler_path=compiler_path,
+            prefix=MUTANT_OBJECT_PREFIX,
+            timeout_seconds=compilation_timeout,
+            env=mutated_environment,
+            source_indices=recompiled_sources,
+            sources=original_sources,
+            driver_jobs=driver_jobs,
+            cpu_time_limit_seconds=compilation_cpu_time_limit,
+            memory_limit_bytes=memory_limit)
+        if mutated_result is None:
+            return KillStatus.KILL_COMPILER_TIMEOUT
+        if mutated_result.returncode != 0:
+            return _compiler_failure_status(mutated_result)
+        if two_stage_build.objects_match_regular(MUTANT_OBJECT_PREFIX, recompiled_sources):
+            return KillStatus.SURVIVED_IDENTICAL
+        mutated_result = two_stage_build.link(
+            compiler_path=compiler_path,
+            object_files=two_stage_build.object_files_for_build(MUTANT_OBJECT_PREFIX, recompiled_sources),
+            exe_path=mutant_exe_path,
+            timeout_seconds=compilation_timeout,
+            env=mutated_environment,
+            driver_jobs=driver_jobs,
+            cpu_time_limit_seconds=compilation_cpu_time_limit,
+            memory_limit_bytes=memory_limit)
+    else:
+        if mutant_exe_path.exists():
+            os.remove(mutant_exe_path)
+        mutated_cmd = [compiler_path] + compiler_args + ['-o', str(mutant_exe_path)]
+        run_compiler = run_process_with_timeout if driver_jobs is None else driver_jobs.run
+        mutated_result: ProcessResult = run_compiler(
+            cmd=mutated_cmd,
+            timeout_seconds=compilation_timeout,
+            env=mutated_environment,
+            cpu_time_limit_seconds=compilation_cpu_time_limit,
+            memory_limit_bytes=memory_limit)
     if mutated_result is None:
         return KillStatus.KILL_COMPILER_TIMEOUT
 
     if mutated_result.returncode != 0:
-        return KillStatus.KILL_COMPILER_CRASH
+        return _compiler_failure_status(mutated_result)
 
-    if binary_hash_non_mutated == hash_file(str(mutant_exe_path)):
+    binary_hash_mutated: str = hash_binary(str(mutant_exe_path))
+    if binary_hash_non_mutated == binary_hash_mutated:
         return KillStatus.SURVIVED_IDENTICAL
 
+    if execution_cache is None:
+        return _execute_mutant(execution_result_non_mutated, run_time, mutant_exe_path, cpu_time_limits, memory_limit,
+                               streaming_output_comparison)
+    outcome: Optional[KillStatus] = execution_cache.lookup(binary_hash_mutated)
+    if outcome is None:
+        outcome = _execute_mutant(execution_result_non_mutated, run_time, mutant_exe_path, cpu_time_limits,
+                                  memory_limit, streaming_output_comparison)
+        execution_cache.add(binary_hash_mutated, outcome)
+    return outcome
+
+
+def _compiler_failure_status(mutated_result: ProcessResult) -> KillStatus:
+    return KillStatus.KILL_COMPILER_OUT_OF_MEMORY if mutated_result.memory_limit_exceeded\
+        else KillStatus.KILL_COMPILER_CRASH
+
+
+def _execute_mutant(execution_result_non_mutated: ProcessResult,
+                    run_time: float,
+                    mutant_exe_path: Path,
+                    cpu_time_limits: bool,
+                    memory_limit: Optional[int],
+                    streaming_output_comparison: bool) -> KillStatus:
+    execution_timeout, execution_cpu_time_limit = _process_time_limits(mutant_execution_timeout(run_time),
+                                                                       cpu_time_limits)
     mutated_execution_result: ProcessResult = run_process_with_timeout(
         cmd=[str(mutant_exe_path)],
-        timeout_seconds=int(max(MIN_TIMEOUT_FOR_MUTANT_EXECUTION,
-                                TIMEOUT_MULTIPLIER_FOR_MUTANT_EXECUTION * run_time)))
+        timeout_seconds=execution_timeout,
+        cpu_time_limit_seconds=execution_cpu_time_limit,
+        memory_limit_bytes=memory_limit,
+        expected_output=execution_result_non_mutated if streaming_output_comparison else None,
+        # The output is captured in the same way as that of the unmutated program, so that the two can be compared.
+        digest_output=isinstance(execution_result_non_mutated.stdout, OutputDigest))
     if mutated_execution_result is None:
         return KillStatus.KILL_RUNTIME_TIMEOUT
 
+    if mutated_execution_result.stdout_diverged:
+        return KillStatus.KILL_DIFFERENT_STDOUT
+
+    if mutated_execution_result.stderr_diverged:
+        return KillStatus.KILL_DIFFERENT_STDERR
+
+    if mutated_execution_result.memory_limit_exceeded:
+        return KillStatus.KILL_RUNTIME_OUT_OF_MEMORY
+
     if execution_result_non_mutated.returncode != mutated_execution_result.returncode:
         return KillStatus.KILL_DIFFERENT_EXIT_CODES
 
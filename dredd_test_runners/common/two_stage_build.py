@@ -0,0 +1,201 @@
+import argparse
+import os
+
+from dredd_test_runners.common.driver_jobs import DriverJobCache
+from dredd_test_runners.common.hash_file import hash_file
+from dredd_test_runners.common.run_process_with_timeout import ProcessResult, run_process_with_timeout
+
+from pathlib import Path
+from typing import Dict, List, Optional, Set
+
+# Extensions of source files, including preprocessed source files.
+SOURCE_FILE_EXTENSIONS: List[str] = ['.c', '.cc', '.cpp', '.cxx', '.i', '.ii']
+
+# Prefixes for the names of the object files of the unmutated build, of mutant builds and of mutant tracking builds.
+REGULAR_OBJECT_PREFIX: str = "__regular_"
+MUTANT_OBJECT_PREFIX: str = "__mutant_"
+TRACKING_OBJECT_PREFIX: str = "__tracking_"
+
+# Prefixes of compiler arguments that only apply when linking, and those of them that may take their value as a separate
+# argument (e.g. '-l m' as well as '-lm').
+LINK_ONLY_ARGUMENT_PREFIXES: List[str] = ['-l', '-L', '-Wl,', '-Xlinker']
+SEPARABLE_LINK_ONLY_ARGUMENTS: List[str] = ['-l', '-L', '-Xlinker']
+
+
+def is_source_file(compiler_arg: str) -> bool:
+    return os.path.splitext(compiler_arg)[1] in SOURCE_FILE_EXTENSIONS
+
+
+def _without_link_only_arguments(flags: List[str]) -> List[str]:
+    result: List[str] = []
+    index: int = 0
+    while index < len(flags):
+        if flags[index] in SEPARABLE_LINK_ONLY_ARGUMENTS:
+            index += 2
+            continue
+        if not any(flags[index].startswith(prefix) for prefix in LINK_ONLY_ARGUMENT_PREFIXES):
+            result.append(flags[index])
+        index += 1
+    return result
+
+
+def add_two_stage_compilation_argument(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument("--two_stage_compilation",
+                        action="store_true",
+                        help="Build each mutant by compiling the test's source files to object files, and link them "
+                             "only if some object file differs from that of the unmutated build; if none differs, the "
+                             "mutant is known to survive without linking. Mutants that only affect the compiler's "
+                             "handling of linking are not detected in this mode.")
+
+
+class TwoStageBuild:
+    # Describes how to build a test in two stages: first each of its source files is compiled to an object file, then
+    # the object files are linked. When a mutant is built this way, its object files can be compared with those of the
+    # unmutated build, and if they are identical then so would be the executable, so the (comparatively slow) link step
+    # can be skipped. Most mutants that a test covers leave the generated code unchanged, so this avoids the linker
+    # for most mutant evaluations.
+    #
+    # If the mutants covered by each source file have been tracked, a mutant build recompiles only the source files
+    # that cover one of the mutants: a mutant that is not reached while compiling a source file cannot change its
+    # object file, so the unmutated build's object file is used instead.
+    #
+    # This assumes that the mutated compiler's mutants only affect code generation, and not linking: a mutant whose
+    # only effect is on linking would go unnoticed if the object files were unchanged.
+    def __init__(self, compiler_args: List[str], object_dir: Path):
+        # Compiler arguments other than source files are passed when linking, as many of them (e.g. optimisation and
+        # sanitizer flags) affect linking too. They are also passed when compiling, except for those that only apply
+        # to linking (e.g. libraries), which would otherwise be reported as unused, or be errors under -Werror.
+        self.link_flags: List[str] = [arg for arg in compiler_args if not is_source_file(arg)]
+        self.compile_flags: List[str] = _without_link_only_arguments(self.link_flags)
+        self.sources: List[str] = [arg for arg in compiler_args if is_source_file(arg)]
+        self.object_dir: Path = object_dir
+        self.regular_object_hashes: List[str] = []
+        # The mutants covered by each source file, if tracked.
+        self.source_covered_mutants: Optional[List[Set[int]]] = None
+
+    def object_files(self, prefix: str) -> List[Path]:
+        return [self.object_dir / f"{prefix}{index}_{Path(source).stem}.o" for index, source in enumerate(self.sources)]
+
+    # Returns the indices of the source files that must be recompiled to build with the given mutants enabled.
+    def sources_covering(self, mutants: List[int]) -> List[int]:
+        if self.source_covered_mutants is None:
+            return list(range(len(self.sources)))
+        return [index for index, covered in enumerate(self.source_covered_mutants)
+                if any(mutant in covered for mutant in mutants)]
+
+    # Compiles the source files with the given indices (by default, all of them) to object files. If 'sources' is
+    # given, it holds a replacement for each source file, e.g. the original version of a preprocessed source file. If
+    # 'driver_jobs' is given, the compiler driver's jobs are run directly (see DriverJobCache). Returns None if a
+    # compilation timed out; otherwise the result of the first compilation that failed, or of the last compilation if
+    # all succeeded (None if there were no source files to compile), accounting for the resources used by all the
+    # compilations.
+    def compile(self,
+                compiler_path: str,
+                prefix: str,
+                timeout_seconds: float,
+                env: Optional[Dict[str, str]] = None,
+                source_indices: Optional[List[int]] = None,
+                sources: Optional[List[str]] = None,
+                driver_jobs: Optional[DriverJobCache] = None,
+                cpu_time_limit_seconds: Optional[float] = None,
+                memory_limit_bytes: Optional[int] = None) -> Optional[ProcessResult]:
+        object_files: List[Path] = self.object_files(prefix)
+        if sources is None:
+            sources = self.sources
+        run_compiler = run_process_with_timeout if driver_jobs is None else driver_jobs.run
+        result: Optional[ProcessResult] = None
+        for index in range(len(self.sources)) if source_indices is None else source_indices:
+            if object_files[index].exists():
+                os.remove(object_files[index])
+            previous_result: Optional[ProcessResult] = result
+            result = run_compiler(cmd=[compiler_path] + self.compile_flags
+                                  + ['-c', sources[index], '-o', str(object_files[index])],
+                                  timeout_seconds=timeout_seconds,
+                                  env=env,
+                                  cpu_time_limit_seconds=cpu_time_limit_seconds,
+                                  memory_limit_bytes=memory_limit_bytes)
+            if result is None:
+                return None
+            if previous_result is not None:
+                result.add_resource_usage(previous_result)
+            if result.returncode != 0:
+                return result
+        return result
+
+    # Returns the object files from which to link a build in which only the source files with the given indices were
+    # compiled with the given prefix; the unmutated build's object files are used for the other source files.
+    def object_files_for_build(self, prefix: str, source_indices: List[int]) -> List[Path]:
+        return [object_file if index in source_indices else regular_object_file
+                for index, (object_file, regular_object_file)
+                in enumerate(zip(self.object_files(prefix), self.object_files(REGULAR_OBJECT_PREFIX)))]
+
+    def link(self,
+             compiler_path: str,
+             object_files: List[Path],
+             exe_path: Path,
+             timeout_seconds: float,
+             env: Optional[Dict[str, str]] = None,
+             driver_jobs: Optional[DriverJobCache] = None,
+             cpu_time_limit_seconds: Optional[float] = None,
+             memory_limit_bytes: Optional[int] = None) -> Optional[ProcessResult]:
+        if exe_path.exists():
+            os.remove(exe_path)
+        run_compiler = run_process_with_timeout if driver_jobs is None else driver_jobs.run
+        # Libraries must come after the object files that use them.
+        return run_compiler(cmd=[compiler_path] + [str(object_file) for object_file in object_files]
+                            + self.link_flags + ['-o', str(exe_path)],
+                            timeout_seconds=timeout_seconds,
+                            env=env,
+                            cpu_time_limit_seconds=cpu_time_limit_seconds,
+                            memory_limit_bytes=memory_limit_bytes)
+
+    # Compiles and links the unmutated build, recording the hashes of its object files. Returns None on a timeout;
+    # otherwise the result of the first step that failed, or of linking if all steps succeeded, accounting for the
+    # resources used by all the steps.
+    def build_regular(self,
+                      compiler_path: str,
+                      exe_path: Path,
+                      timeout_seconds: float,
+                      memory_limit_bytes: Optional[int] = None) -> Optional[ProcessResult]:
+        compile_result: Optional[ProcessResult] = self.compile(compiler_path, REGULAR_OBJECT_PREFIX, timeout_seconds,
+                                                               memory_limit_bytes=memory_limit_bytes)
+        if compile_result is None or compile_result.returncode != 0:
+            return compile_result
+        self.regular_object_hashes = [hash_file(str(object_file))
+                                      for object_file in self.object_files(REGULAR_OBJECT_PREFIX)]
+        link_result: Optional[ProcessResult] = self.link(compiler_path, self.object_files(REGULAR_OBJECT_PREFIX),
+                                                         exe_path, timeout_seconds,
+                                                         memory_limit_bytes=memory_limit_bytes)
+        if link_result is not None:
+            link_result.add_resource_usage(compile_result)
+        return link_result
+
+    # Compiles each source file (or its replacement in 'sources', as for 'compile') with the mutant tracking compiler,
+    # recording the mutants that each covers. If 'driver_jobs' is given, the compiler driver's jobs are run directly,
+    # as they will be for mutant builds. Returns the mutants covered by any source file, sorted and without duplicates,
+    # or None if a compilation timed out.
+    def track_coverage(self,
+                       tracking_compiler_path: str,
+                       timeout_seconds: float,
+                       sources: Optional[List[str]] = None,
+                       driver_jobs: Optional[DriverJobCache] = None) -> Optional[List[int]]:
+        source_covered_mutants: List[Set[int]] = []
+        for index in range(len(self.sources)):
+            covered_mutants_path: Path = self.object_dir / f"{TRACKING_OBJECT_PREFIX}{index}_covered_mutants"
+            if covered_mutants_path.exists():
+                os.remove(covered_mutants_path)
+            tracking_environment = os.environ.copy()
+            tracking_environment["DREDD_MUTANT_TRACKING_FILE"] = str(covered_mutants_path)
+            if self.compile(tracking_compiler_path, TRACKING_OBJECT_PREFIX, timeout_seconds, env=tracking_environment,
+                            source_indices=[index], sources=sources, driver_jobs=driver_jobs) is None:
+                return None
+            # The tracking file is only written if some mutant is covered.
+            source_covered_mutants.append(set([int(line.strip()) for line in open(covered_mutants_path, 'r')])
+                                          if covered_mutants_path.exists() else set())
+        self.source_covered_mutants = source_covered_mutants
+        return sorted(set().union(*source_covered_mutants))
+
+    def objects_match_regular(self, prefix: str, source_indices: Optional[List[int]] = None) -> bool:
+        object_files: List[Path] = self.object_files(prefix)
+        return all(hash_file(str(object_files[index])) == self.regular_object_hashes[index]
+                   for index in (range(len(self.sources)) if source_indices is None else source_indices))
@@ -0,0 +1,60 @@
+import multiprocessing
+import signal
+import sys
+
+from typing import Any, Callable, Sequence
+
+# Time in seconds that workers are given to tidy up (killing their child processes and removing temporary files) after
+# being asked to terminate, before they are killed outright.
+WORKER_SHUTDOWN_GRACE_PERIOD: float = 10.0
+
+
+def _exit_on_sigterm(signum, _) -> None:
+    # Raising SystemExit, rather than dying immediately, means that 'finally' blocks run: this is what allows a worker
+    # to kill any compiler or generated program it is waiting on, and to remove its temporary directory.
+    sys.exit(128 + signum)
+
+
+def _run_worker(target: Callable[..., None], worker_id: int, target_args: Sequence[Any]) -> None:
+    signal.signal(signal.SIGTERM, _exit_on_sigterm)
+    try:
+        target(worker_id, *target_args)
+    except KeyboardInterrupt:
+        pass
+
+
+def run_worker_pool(num_workers: int, target: Callable[..., None], target_args: Sequence[Any]) -> None:
+    # Calls 'target(worker_id, *target_args)' in each of 'num_workers' processes. The workers are forked, so that large
+    # read-only data structures built by the parent (such as mutation trees) are shared with the workers rather than
+    # copied or re-built, as is shared-memory state such as the set of killed mutants.
+    assert num_workers > 0
+    if num_workers == 1:
+        # No need for a separate process.
+        _run_worker(target, 0, target_args)
+        return
+
+    context = multiprocessing.get_context('fork')
+    workers = [context.Process(target=_run_worker, args=(target, worker_id, target_args))
+               for worker_id in range(num_workers)]
+    # Make sure that the workers are shut down if this process is asked to terminate.
+    previous_sigterm_handler = signal.signal(signal.SIGTERM, _exit_on_sigterm)
+    for worker in workers:
+        worker.start()
+    try:
+        for worker in workers:
+            worker.join()
+    except KeyboardInterrupt:
+        print("Interrupted; shutting down workers.")
+    finally:
+        for worker in workers:
+            if worker.is_alive():
+                worker.terminate()
+        for worker in workers:
+            worker.join(timeout=WORKER_SHUTDOWN_GRACE_PERIOD)
+            if worker.is_alive():
+                worker.kill()
+                worker.join()
+        signal.signal(signal.SIGTERM, previous_sigterm_handler)
+    for worker_id, worker in enumerate(workers):
+        if worker.exitcode != 0:
+            print(f"Worker {worker_id} exited with code {worker.exitcode}.")
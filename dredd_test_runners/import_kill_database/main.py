@@ -0,0 +1,36 @@
+import argparse
+import sys
+
+from dredd_test_runners.common.kill_database import import_work_directory, open_kill_database
+
+from pathlib import Path
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("work_dir",
+                        help="Directory containing test results in the format used by earlier versions of the "
+                             "runners. It should have subdirectories, 'tests' and 'killed_mutants'. The results are "
+                             "added to the kill database in this directory, which is created if necessary.",
+                        type=Path)
+    args = parser.parse_args()
+    work_dir: Path = args.work_dir
+    if not work_dir.exists() or not work_dir.is_dir():
+        print(f"Error: {str(work_dir)} is not a working directory.")
+        sys.exit(1)
+    tests_dir = work_dir / "tests"
+    if not tests_dir.exists() or not tests_dir.is_dir():
+        print(f"Error: {str(tests_dir)} does not exist.")
+        sys.exit(1)
+    killed_mutants_dir = work_dir / "killed_mutants"
+    if not killed_mutants_dir.exists() or not killed_mutants_dir.is_dir():
+        print(f"Error: {str(killed_mutants_dir)} does not exist.")
+        sys.exit(1)
+
+    with open_kill_database(work_dir) as kill_database:
+        kills_imported, summaries_imported = import_work_directory(work_dir, kill_database)
+    print(f"Imported {kills_imported} kills and {summaries_imported} test summaries.")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,12 +1,15 @@
 import argparse
-import json
 import os
 import tempfile
 import time
 
 from enum import Enum
 from pathlib import Path
+from dredd_test_runners.common.kill_database import lease_holder_id, MUTANT_LEASE_GRACE_PERIOD, open_kill_database
+from dredd_test_runners.common.mutant_group_testing import DEFERRED_MUTANT_RETRY_INTERVAL
 from dredd_test_runners.common.mutation_tree import MutationTree
+from dredd_test_runners.common.mutation_tree_cache import (add_mutation_tree_cache_argument,
+                                                            load_checked_mutation_tree)
 from dredd_test_runners.common.run_process_with_timeout import ProcessResult, run_process_with_timeout
 
 from typing import AnyStr, Dict, List, Set
@@ -41,38 +44,30 @@ def main():
     parser.add_argument("regression_tests_mutant_tracking_root",
                         help="Corresponding path to this directory under the mutant tracking build of the compiler.",
                         type=Path)
+    add_mutation_tree_cache_argument(parser)
     args = parser.parse_args()
 
     assert args.mutation_info_file != args.mutation_info_file_for_mutant_coverage_tracking
 
-    print("Building the real mutation tree...")
-    with open(args.mutation_info_file, 'r') as json_input:
-        mutation_tree = MutationTree(json.load(json_input))
-    print("Built!")
-    print("Building the mutation tree associated with mutant coverage tracking...")
-    with open(args.mutation_info_file_for_mutant_coverage_tracking, 'r') as json_input:
-        mutation_tree_for_coverage_tracking = MutationTree(json.load(json_input))
-    print("Built!")
-    print("Checking that the two mutation trees match...")
-    assert mutation_tree.mutation_id_to_node_id == mutation_tree_for_coverage_tracking.mutation_id_to_node_id
-    assert mutation_tree.parent_map == mutation_tree_for_coverage_tracking.parent_map
-    assert mutation_tree.num_nodes == mutation_tree_for_coverage_tracking.num_nodes
-    assert mutation_tree.num_mutations == mutation_tree_for_coverage_tracking.num_mutations
-    print("Check complete!")
-
-    with tempfile.TemporaryDirectory() as temp_dir_for_generated_code:
+    mutation_tree: MutationTree = load_checked_mutation_tree(
+        mutation_info_file=args.mutation_info_file,
+        mutation_info_file_for_mutant_coverage_tracking=args.mutation_info_file_for_mutant_coverage_tracking,
+        cache_dir=args.mutation_tree_cache_dir)
+
+    # Make a work directory in which information about the mutant killing process will be stored. If this already exists
+    # that's OK - there may be other processes working on mutant killing, or we may be continuing a job that crashed
+    # previously.
+    Path("work").mkdir(exist_ok=True)
+    Path("work/tests").mkdir(exist_ok=True)
+
+    with tempfile.TemporaryDirectory() as temp_dir_for_generated_code, \
+            open_kill_database(Path("work")) as kill_database:
         dredd_covered_mutants_path: Path = Path(temp_dir_for_generated_code, '__dredd_covered_mutants')
 
         killed_mutants: Set[int] = set()
+        lease_holder: str = lease_holder_id()
         unkilled_mutants: Set[int] = set(range(0, mutation_tree.num_mutations))
 
-        # Make a work directory in which information about the mutant killing process will be stored. If this already
-        # exists that's OK - there may be other processes working on mutant killing, or we may be continuing a job that
-        # crashed previously.
-        Path("work").mkdir(exist_ok=True)
-        Path("work/tests").mkdir(exist_ok=True)
-        Path("work/killed_mutants").mkdir(exist_ok=True)
-
         # Find all the regression tests under the regression tests root directory. These are all the files with the
         # '.ll' extension.
         tests = []
@@ -143,6 +138,12 @@ def main():
             covered_by_this_test: List[int] = list(set([int(line.strip()) for line in
                                                         open(dredd_covered_mutants_path, 'r').readlines()]))
             covered_by_this_test.sort()
+
+            # Catch up with the mutants killed by other runners sharing the work directory, so that the candidates for
+            # this test are accurate.
+            killed_mutants.update(kill_database.get_killed_mutants())
+            unkilled_mutants.difference_update(killed_mutants)
+
             candidate_mutants_for_this_test: List[int] = ([m for m in covered_by_this_test if m not in killed_mutants])
             print("Number of mutants to try: " + str(len(candidate_mutants_for_this_test)))
 
@@ -150,50 +151,64 @@ def main():
             killed_by_this_test: List[int] = []
             covered_but_not_killed_by_this_test: List[int] = []
 
-            for mutant in candidate_mutants_for_this_test:
-                mutant_path = Path("work/killed_mutants/" + str(mutant))
-                if mutant_path.exists():
+            mutant_timeout: int = int(max(1.0, 5.0 * test_time))
+            # Lease mutants before testing them, so that runners sharing the work directory do not evaluate the same
+            # mutants at the same time. Mutants leased by another runner are deferred until the others have been tried,
+            # in the hope that they will have been killed by then.
+            remaining: List[int] = candidate_mutants_for_this_test
+            deferred: List[int] = []
+            while remaining or deferred:
+                if not remaining:
+                    time.sleep(DEFERRED_MUTANT_RETRY_INTERVAL)
+                    remaining, deferred = deferred, []
+                mutant: int = remaining.pop(0)
+                if kill_database.is_killed(mutant):
                     print("Skipping mutant " + str(mutant) + " as it is noted as already killed.")
                     unkilled_mutants.remove(mutant)
                     killed_mutants.add(mutant)
                     already_killed_by_other_tests.append(mutant)
                     continue
-                print("Trying mutant " + str(mutant))
-                mutated_environment = os.environ.copy()
-                mutated_environment["DREDD_ENABLED_MUTATION"] = str(mutant)
-                mutated_test_result: ProcessResult = run_process_with_timeout(
-                    cmd=[args.mutated_compiler_bin_dir / "llvm-lit",
-                         test_filename],
-                    timeout_seconds=int(max(1.0, 5.0 * test_time)),
-                    env=mutated_environment)
-
-                if mutated_test_result is None:
-                    mutant_result = KillStatus.KILL_TIMEOUT
-                elif mutated_test_result.returncode != 0:
-                    mutant_result = KillStatus.KILL_FAIL
-                else:
-                    mutant_result = KillStatus.SURVIVED
-
-                print("Mutant result: " + str(mutant_result))
-                if mutant_result == KillStatus.SURVIVED:
-                    covered_but_not_killed_by_this_test.append(mutant)
+                if not kill_database.acquire_leases(mutants=[mutant],
+                                                    holder=lease_holder,
+                                                    duration=mutant_timeout + MUTANT_LEASE_GRACE_PERIOD):
+                    deferred.append(mutant)
                     continue
-
-                unkilled_mutants.remove(mutant)
-                killed_mutants.add(mutant)
-                killed_by_this_test.append(mutant)
-                print(f"Kill! Mutants killed so far: {len(killed_mutants)}")
                 try:
-                    mutant_path.mkdir()
-                    print("Writing kill info to file.")
-                    with open(mutant_path / "kill_info.json", "w") as outfile:
-                        json.dump({"killing_test": test_filename_without_prefix, "kill_type": str(mutant_result)},
-                                  outfile)
-                except FileExistsError:
-                    print(f"Mutant {mutant} was independently discovered to be killed.")
-                    continue
+                    print("Trying mutant " + str(mutant))
+                    mutated_environment = os.environ.copy()
+                    mutated_environment["DREDD_ENABLED_MUTATION"] = str(mutant)
+                    mutated_test_result: ProcessResult = run_process_with_timeout(
+                        cmd=[args.mutated_compiler_bin_dir / "llvm-lit",
+                             test_filename],
+                        timeout_seconds=mutant_timeout,
+                        env=mutated_environment)
+
+                    if mutated_test_result is None:
+                        mutant_result = KillStatus.KILL_TIMEOUT
+                    elif mutated_test_result.returncode != 0:
+                        mutant_result = KillStatus.KILL_FAIL
+                    else:
+                        mutant_result = KillStatus.SURVIVED
+
+                    print("Mutant result: " + str(mutant_result))
+                    if mutant_result == KillStatus.SURVIVED:
+                        covered_but_not_killed_by_this_test.append(mutant)
+                        continue
 
-            # Now that analysis for this test case has completed, write summary information to its directory
+                    unkilled_mutants.remove(mutant)
+                    killed_mutants.add(mutant)
+                    killed_by_this_test.append(mutant)
+                    print(f"Kill! Mutants killed so far: {len(killed_mutants)}")
+                    if kill_database.add_kill(mutant=mutant,
+                                              killing_test=test_filename_without_prefix,
+                                              kill_type=str(mutant_result)):
+                        print("Recorded kill in database.")
+                    else:
+                        print(f"Mutant {mutant} was independently discovered to be killed.")
+                finally:
+                    kill_database.release_leases(mutants=[mutant], holder=lease_holder)
+
+            # Now that analysis for this test case has completed, record summary information for it
             all_considered_mutants = killed_by_this_test \
                 + covered_but_not_killed_by_this_test \
                 + already_killed_by_other_tests
@@ -203,12 +218,12 @@ def main():
             killed_by_this_test.sort()
             covered_but_not_killed_by_this_test.sort()
             already_killed_by_other_tests.sort()
-            with open(test_output_directory / "kill_summary.json", "w") as outfile:
-                json.dump({"test": test_filename_without_prefix,
-                           "covered_mutants": covered_by_this_test,
-                           "killed_mutants": killed_by_this_test,
-                           "skipped_mutants": already_killed_by_other_tests,
-                           "survived_mutants": covered_but_not_killed_by_this_test}, outfile)
+            kill_database.add_test_summary(test=test_filename_without_prefix,
+                                           terminated_early=None,
+                                           covered_mutants=covered_by_this_test,
+                                           killed_mutants=killed_by_this_test,
+                                           skipped_mutants=already_killed_by_other_tests,
+                                           survived_mutants=covered_but_not_killed_by_this_test)
 
 
 if __name__ == '__main__':
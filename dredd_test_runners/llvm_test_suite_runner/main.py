@@ -1,16 +1,30 @@
 import argparse
 import json
 import os
-import time
 import tempfile
 
 from pathlib import Path
-from dredd_test_runners.common.hash_file import hash_file
+from dredd_test_runners.common.baseline_timing import BaselineTiming
+from dredd_test_runners.common.constants import BASELINE_EXECUTION_SAMPLES
+from dredd_test_runners.common.driver_jobs import add_direct_cc1_argument, DriverJobCache
+from dredd_test_runners.common.kill_database import lease_holder_id, MUTANT_LEASE_GRACE_PERIOD, open_kill_database
+from dredd_test_runners.common.mutant_group_testing import (add_max_mutant_group_size_argument, is_survived,
+                                                            max_runs_to_test_mutant_group, run_test_with_mutant_groups)
 from dredd_test_runners.common.mutation_tree import MutationTree
+from dredd_test_runners.common.mutation_tree_cache import (add_mutation_tree_cache_argument,
+                                                            load_checked_mutation_tree)
+from dredd_test_runners.common.output_digest import add_bounded_output_capture_argument
 from dredd_test_runners.common.run_process_with_timeout import ProcessResult, run_process_with_timeout
-from dredd_test_runners.common.run_test_with_mutants import run_test_with_mutants, KillStatus
+from dredd_test_runners.common.run_test_with_mutants import (add_binary_comparison_argument,
+                                                             add_cpu_time_limits_argument, add_memory_limit_argument,
+                                                             add_streaming_output_comparison_argument,
+                                                             BINARY_HASH_FUNCTIONS, memory_limit_bytes,
+                                                             mutant_test_time_limit, MutantExecutionCache,
+                                                             run_test_with_mutants, KillStatus, TimeoutStatistics)
+from dredd_test_runners.common.two_stage_build import (add_two_stage_compilation_argument, TRACKING_OBJECT_PREFIX,
+                                                       TwoStageBuild)
 
-from typing import AnyStr, List, Set
+from typing import AnyStr, List, Optional, Set
 
 
 def main():
@@ -35,41 +49,41 @@ def main():
     parser.add_argument("llvm_test_suite_compilation_database",
                         help="Path to a compilation database for the LLVM test suite (generated using CMake).",
                         type=Path)
+    add_max_mutant_group_size_argument(parser)
+    add_binary_comparison_argument(parser)
+    add_cpu_time_limits_argument(parser)
+    add_memory_limit_argument(parser)
+    add_streaming_output_comparison_argument(parser)
+    add_bounded_output_capture_argument(parser)
+    add_two_stage_compilation_argument(parser)
+    add_direct_cc1_argument(parser)
+    add_mutation_tree_cache_argument(parser)
     args = parser.parse_args()
 
     assert args.mutation_info_file != args.mutation_info_file_for_mutant_coverage_tracking
 
-    print("Building the real mutation tree...")
-    with open(args.mutation_info_file, 'r') as json_input:
-        mutation_tree = MutationTree(json.load(json_input))
-    print("Built!")
-    print("Building the mutation tree associated with mutant coverage tracking...")
-    with open(args.mutation_info_file_for_mutant_coverage_tracking, 'r') as json_input:
-        mutation_tree_for_coverage_tracking = MutationTree(json.load(json_input))
-    print("Built!")
-    print("Checking that the two mutation trees match...")
-    assert mutation_tree.mutation_id_to_node_id == mutation_tree_for_coverage_tracking.mutation_id_to_node_id
-    assert mutation_tree.parent_map == mutation_tree_for_coverage_tracking.parent_map
-    assert mutation_tree.num_nodes == mutation_tree_for_coverage_tracking.num_nodes
-    assert mutation_tree.num_mutations == mutation_tree_for_coverage_tracking.num_mutations
-    print("Check complete!")
-
-    with tempfile.TemporaryDirectory() as temp_dir_for_generated_code:
+    mutation_tree: MutationTree = load_checked_mutation_tree(
+        mutation_info_file=args.mutation_info_file,
+        mutation_info_file_for_mutant_coverage_tracking=args.mutation_info_file_for_mutant_coverage_tracking,
+        cache_dir=args.mutation_tree_cache_dir)
+
+    # Make a work directory in which information about the mutant killing process will be stored. If this already exists
+    # that's OK - there may be other processes working on mutant killing, or we may be continuing a job that crashed
+    # previously.
+    Path("work").mkdir(exist_ok=True)
+    Path("work/tests").mkdir(exist_ok=True)
+
+    with tempfile.TemporaryDirectory() as temp_dir_for_generated_code, \
+            open_kill_database(Path("work")) as kill_database:
         regular_exe_path: Path = Path(temp_dir_for_generated_code, '__exe')
         dredd_covered_mutants_path: Path = Path(temp_dir_for_generated_code, '__dredd_covered_mutants')
         mutant_tracking_exe_path: Path = Path(temp_dir_for_generated_code, '__mutant_tracking_exe')
         mutant_exe_path: Path = Path(temp_dir_for_generated_code, '__mutant_exe')
+        lease_holder: str = lease_holder_id()
 
         killed_mutants: Set[int] = set()
         unkilled_mutants: Set[int] = set(range(0, mutation_tree.num_mutations))
 
-        # Make a work directory in which information about the mutant killing process will be stored. If this already
-        # exists that's OK - there may be other processes working on mutant killing, or we may be continuing a job that
-        # crashed previously.
-        Path("work").mkdir(exist_ok=True)
-        Path("work/tests").mkdir(exist_ok=True)
-        Path("work/killed_mutants").mkdir(exist_ok=True)
-
         llvm_test_suite_compile_commands = json.load(open(args.llvm_test_suite_compilation_database, 'r'))
         regression_prefix = str(args.llvm_test_suite_root) + "/SingleSource/Regression"
         unit_tests_prefix = str(args.llvm_test_suite_root) + "/SingleSource/UnitTests"
@@ -127,11 +141,24 @@ def main():
                 args.mutated_compiler_bin_dir) + os.sep + "clang++"] + compiler_args + ['-o', str(regular_exe_path)]
             print("Compile command:")
             print(' '.join(regular_cmd))
-            compile_time_start: float = time.time()
-            regular_result: ProcessResult = run_process_with_timeout(cmd=regular_cmd, timeout_seconds=60)
+            # In two-stage mode, the regular executable is built in the same way that mutants will be built, so that the
+            # resulting executables are comparable.
+            two_stage_build: Optional[TwoStageBuild] = TwoStageBuild(compiler_args, Path(temp_dir_for_generated_code))\
+                if args.two_stage_compilation else None
+            # The test is compiled and run within the memory limit that will apply to mutants.
+            memory_limit: Optional[int] = memory_limit_bytes(args.memory_limit_mb)
+            compile_timing: BaselineTiming = BaselineTiming(cpu_time=args.cpu_time_limits)
+            if two_stage_build is not None:
+                regular_result: ProcessResult = compile_timing.measure(
+                    lambda: two_stage_build.build_regular(compiler_path=regular_cmd[0],
+                                                          exe_path=regular_exe_path,
+                                                          timeout_seconds=60,
+                                                          memory_limit_bytes=memory_limit))
+            else:
+                regular_result: ProcessResult = compile_timing.measure(
+                    lambda: run_process_with_timeout(cmd=regular_cmd, timeout_seconds=60,
+                                                     memory_limit_bytes=memory_limit))
             assert regular_result is not None  # We do not expect regular compilation to time out.
-            compile_time_end: float = time.time()
-            compile_time = compile_time_end - compile_time_start
 
             if regular_result.returncode != 0:
                 print("Skipping test " + test_filename + " as it failed to compile. Details:")
@@ -140,32 +167,80 @@ def main():
                 print(regular_result.stderr.decode('utf-8'))
                 continue
 
-            regular_hash = hash_file(str(regular_exe_path))
+            hash_binary = BINARY_HASH_FUNCTIONS[args.binary_comparison]
+            regular_hash = hash_binary(str(regular_exe_path))
 
-            run_time_start: float = time.time()
-            regular_execution_result: ProcessResult = run_process_with_timeout(cmd=[str(regular_exe_path)],
-                                                                               timeout_seconds=60)
-            assert regular_execution_result is not None  # We do not expect regular compilation to time out.
-            run_time_end: float = time.time()
-            run_time = run_time_end - run_time_start
+            # The test is run several times, to estimate its run time reliably; every run must behave in the same way.
+            run_timing: BaselineTiming = BaselineTiming(cpu_time=args.cpu_time_limits)
+            regular_execution_results: List[ProcessResult] = [
+                run_timing.measure(lambda: run_process_with_timeout(cmd=[str(regular_exe_path)],
+                                                                    timeout_seconds=60,
+                                                                    memory_limit_bytes=memory_limit,
+                                                                    digest_output=args.bounded_output_capture))
+                for _ in range(BASELINE_EXECUTION_SAMPLES)]
+            if any(result is None for result in regular_execution_results):
+                print("Skipping test " + test_filename + " as it timed out without mutants.")
+                continue
+            regular_execution_result: ProcessResult = regular_execution_results[0]
+            if regular_execution_result.memory_limit_exceeded:
+                print("Skipping test " + test_filename + " as it exceeded the memory limit without mutants.")
+                continue
+            if any((result.returncode, result.stdout, result.stderr) != (regular_execution_result.returncode,
+                                                                          regular_execution_result.stdout,
+                                                                          regular_execution_result.stderr)
+                   for result in regular_execution_results):
+                print("Skipping test " + test_filename + " as it behaves differently when run repeatedly.")
+                continue
 
-            tracking_environment: dict[AnyStr, AnyStr] = os.environ.copy()
-            tracking_environment["DREDD_MUTANT_TRACKING_FILE"] = str(dredd_covered_mutants_path)
             exe_name: str = "clang" if is_c else "clang++"
-            mutant_tracking_cmd = [str(args.mutant_tracking_compiler_bin_dir) + os.sep + exe_name]\
-                + compiler_args\
-                + ['-o', str(mutant_tracking_exe_path)]
-            run_process_with_timeout(cmd=mutant_tracking_cmd,
-                                     timeout_seconds=60,
-                                     env=tracking_environment)
+            # Mutants are tracked in the same way as they will be built, so that with --direct_cc1 a mutant that is
+            # only reached in the compiler driver, and so would never be enabled, is not counted as covered.
+            driver_jobs: Optional[DriverJobCache] = DriverJobCache(Path(temp_dir_for_generated_code))\
+                if args.direct_cc1 else None
+            if two_stage_build is not None:
+                # Track the mutants covered by each source file separately, so that evaluating a mutant only needs to
+                # recompile the source files that cover it.
+                # The tracking compilation is timed as a further sample of the compile time. The tracking compiler
+                # only differs from the mutated compiler by its instrumentation, so this is an approximation: with two
+                # samples, the estimate is the mean of the times taken by the two compilers.
+                covered_by_this_test: List[int] = compile_timing.measure(lambda: two_stage_build.track_coverage(
+                    tracking_compiler_path=str(args.mutant_tracking_compiler_bin_dir) + os.sep + exe_name,
+                    timeout_seconds=60,
+                    driver_jobs=driver_jobs))
+                assert covered_by_this_test is not None  # We do not expect tracking compilation to time out.
+
+                # Sanity check: confirm that the mutant tracking objects are no different to the regular objects.
+                assert two_stage_build.objects_match_regular(TRACKING_OBJECT_PREFIX)
+            else:
+                tracking_environment: dict[AnyStr, AnyStr] = os.environ.copy()
+                tracking_environment["DREDD_MUTANT_TRACKING_FILE"] = str(dredd_covered_mutants_path)
+                mutant_tracking_cmd = [str(args.mutant_tracking_compiler_bin_dir) + os.sep + exe_name]\
+                    + compiler_args\
+                    + ['-o', str(mutant_tracking_exe_path)]
+                # The tracking compilation is timed as a further sample of the compile time; as above, this is an
+                # approximation.
+                run_compiler = run_process_with_timeout if driver_jobs is None else driver_jobs.run
+                compile_timing.measure(lambda: run_compiler(cmd=mutant_tracking_cmd,
+                                                            timeout_seconds=60,
+                                                            env=tracking_environment))
+
+                # Sanity check: confirm that the mutant tracking exe is no different to the regular exe.
+                assert regular_hash == hash_binary(str(mutant_tracking_exe_path))
+
+                # Load file contents into a list. We go from list to set to list to eliminate duplicates.
+                covered_by_this_test: List[int] = list(set([int(line.strip()) for line in
+                                                            open(dredd_covered_mutants_path, 'r').readlines()]))
+                covered_by_this_test.sort()
 
-            # Sanity check: confirm that the mutant tracking exe is no different to the regular exe.
-            assert regular_hash == hash_file(str(mutant_tracking_exe_path))
+            compile_time: float = compile_timing.estimate()
+            run_time: float = run_timing.estimate()
+            print(f"Compile time: {compile_timing}")
+            print(f"Run time: {run_timing}")
 
-            # Load file contents into a list. We go from list to set to list to eliminate duplicates.
-            covered_by_this_test: List[int] = list(set([int(line.strip()) for line in
-                                                        open(dredd_covered_mutants_path, 'r').readlines()]))
-            covered_by_this_test.sort()
+            # Catch up with the mutants killed by other runners sharing the work directory, so that the candidates for
+            # this test are accurate.
+            killed_mutants.update(kill_database.get_killed_mutants())
+            unkilled_mutants.difference_update(killed_mutants)
 
             candidate_mutants_for_this_test: List[int] = ([m for m in covered_by_this_test if m not in killed_mutants])
             print("Number of mutants to try: " + str(len(candidate_mutants_for_this_test)))
@@ -174,27 +249,66 @@ def main():
             killed_by_this_test: List[int] = []
             covered_but_not_killed_by_this_test: List[int] = []
 
-            for mutant in candidate_mutants_for_this_test:
-                mutant_path = Path("work/killed_mutants/" + str(mutant))
-                if mutant_path.exists():
-                    print("Skipping mutant " + str(mutant) + " as it is noted as already killed.")
+            execution_cache: MutantExecutionCache = MutantExecutionCache()
+            timeout_statistics: TimeoutStatistics = TimeoutStatistics(compile_time, run_time)
+
+            def is_killed(mutant: int) -> bool:
+                if mutant in killed_mutants:
+                    return True
+                if kill_database.is_killed(mutant):
                     unkilled_mutants.remove(mutant)
                     killed_mutants.add(mutant)
+                    return True
+                return False
+
+            def run_test(mutants: List[int]) -> KillStatus:
+                print("Trying mutants " + ', '.join([str(m) for m in mutants]))
+                result: KillStatus = run_test_with_mutants(mutants=mutants,
+                                                           compiler_path=str(
+                                                               args.mutated_compiler_bin_dir) + os.sep + exe_name,
+                                                           compiler_args=compiler_args,
+                                                           compile_time=compile_time,
+                                                           run_time=run_time,
+                                                           binary_hash_non_mutated=regular_hash,
+                                                           execution_result_non_mutated=regular_execution_result,
+                                                           mutant_exe_path=mutant_exe_path,
+                                                           execution_cache=execution_cache,
+                                                           hash_binary=hash_binary,
+                                                           two_stage_build=two_stage_build,
+                                                           driver_jobs=driver_jobs,
+                                                           cpu_time_limits=args.cpu_time_limits,
+                                                           memory_limit=memory_limit,
+                                                           streaming_output_comparison=args.streaming_output_comparison)
+                timeout_statistics.record(result)
+                print("Mutant result: " + str(result))
+                return result
+
+            # Lease mutants before testing them, so that runners sharing the work directory do not evaluate the same
+            # mutants at the same time.
+            def claim(mutants: List[int]) -> List[int]:
+                return kill_database.acquire_leases(
+                    mutants=mutants,
+                    holder=lease_holder,
+                    duration=max_runs_to_test_mutant_group(len(mutants))
+                    * mutant_test_time_limit(compile_time, run_time, args.cpu_time_limits)
+                    + MUTANT_LEASE_GRACE_PERIOD)
+
+            def release(mutants: List[int]) -> None:
+                kill_database.release_leases(mutants=mutants, holder=lease_holder)
+
+            for mutant, mutant_result in run_test_with_mutant_groups(mutants=candidate_mutants_for_this_test,
+                                                                     mutation_tree=mutation_tree,
+                                                                     max_group_size=args.max_mutant_group_size,
+                                                                     run_test=run_test,
+                                                                     is_killed=is_killed,
+                                                                     still_testing=lambda: True,
+                                                                     claim=claim,
+                                                                     release=release):
+                if mutant_result is None:
+                    print("Skipping mutant " + str(mutant) + " as it is noted as already killed.")
                     already_killed_by_other_tests.append(mutant)
                     continue
-                print("Trying mutant " + str(mutant))
-                mutant_result = run_test_with_mutants(mutants=[mutant],
-                                                      compiler_path=str(
-                                                          args.mutated_compiler_bin_dir) + os.sep + exe_name,
-                                                      compiler_args=compiler_args,
-                                                      compile_time=compile_time,
-                                                      run_time=run_time,
-                                                      binary_hash_non_mutated=regular_hash,
-                                                      execution_result_non_mutated=regular_execution_result,
-                                                      mutant_exe_path=mutant_exe_path)
-                print("Mutant result: " + str(mutant_result))
-                if mutant_result == KillStatus.SURVIVED_IDENTICAL\
-                        or mutant_result == KillStatus.SURVIVED_BINARY_DIFFERENCE:
+                if is_survived(mutant_result):
                     covered_but_not_killed_by_this_test.append(mutant)
                     continue
 
@@ -202,17 +316,17 @@ def main():
                 killed_mutants.add(mutant)
                 killed_by_this_test.append(mutant)
                 print(f"Kill! Mutants killed so far: {len(killed_mutants)}")
-                try:
-                    mutant_path.mkdir()
-                    print("Writing kill info to file.")
-                    with open(mutant_path / "kill_info.json", "w") as outfile:
-                        json.dump({"killing_test": test_filename_without_llvm_test_suite_prefix,
-                                   "kill_type": str(mutant_result)}, outfile)
-                except FileExistsError:
+                if kill_database.add_kill(mutant=mutant,
+                                          killing_test=test_filename_without_llvm_test_suite_prefix,
+                                          kill_type=str(mutant_result)):
+                    print("Recorded kill in database.")
+                else:
                     print(f"Mutant {mutant} was independently discovered to be killed.")
-                    continue
 
-            # Now that analysis for this test case has completed, write summary information to its directory
+            print(f"Mutant execution cache for {test_filename}: {execution_cache}")
+            print(f"Mutant timeouts for {test_filename}: {timeout_statistics}")
+
+            # Now that analysis for this test case has completed, record summary information for it
             all_considered_mutants = killed_by_this_test\
                 + covered_but_not_killed_by_this_test\
                 + already_killed_by_other_tests
@@ -222,12 +336,12 @@ def main():
             killed_by_this_test.sort()
             covered_but_not_killed_by_this_test.sort()
             already_killed_by_other_tests.sort()
-            with open(test_output_directory / "kill_summary.json", "w") as outfile:
-                json.dump({"test": test_filename_without_llvm_test_suite_prefix,
-                           "covered_mutants": covered_by_this_test,
-                           "killed_mutants": killed_by_this_test,
-                           "skipped_mutants": already_killed_by_other_tests,
-                           "survived_mutants": covered_but_not_killed_by_this_test}, outfile)
+            kill_database.add_test_summary(test=test_filename_without_llvm_test_suite_prefix,
+                                           terminated_early=None,
+                                           covered_mutants=covered_by_this_test,
+                                           killed_mutants=killed_by_this_test,
+                                           skipped_mutants=already_killed_by_other_tests,
+                                           survived_mutants=covered_but_not_killed_by_this_test)
 
 
 if __name__ == '__main__':
@@ -1,6 +1,5 @@
 import argparse
 import jinja2
-import json
 import os
 import shutil
 import stat
@@ -11,6 +10,8 @@ from dredd_test_runners.common.constants import (DEFAULT_RUNTIME_TIMEOUT,
                                                  TIMEOUT_MULTIPLIER_FOR_MUTANT_COMPILATION,
                                                  MIN_TIMEOUT_FOR_MUTANT_EXECUTION,
                                                  TIMEOUT_MULTIPLIER_FOR_MUTANT_EXECUTION)
+from dredd_test_runners.common.generated_program_runner import read_test_compiler_flags
+from dredd_test_runners.common.kill_database import KILL_DATABASE_FILENAME, open_kill_database
 from dredd_test_runners.common.run_process_with_timeout import ProcessResult, run_process_with_timeout
 
 from pathlib import Path
@@ -20,8 +21,8 @@ from typing import Dict, List, Optional
 def main():
     parser = argparse.ArgumentParser()
     parser.add_argument("work_dir",
-                        help="Directory containing test results. It should have subdirectories, 'tests' and "
-                             "'killed_mutants'.",
+                        help="Directory containing test results. It should have a subdirectory, 'tests', and "
+                             f"contain a kill database, '{KILL_DATABASE_FILENAME}'.",
                         type=Path)
     parser.add_argument("mutated_compiler_executable",
                         help="Path to the executable for the Dredd-mutated compiler.",
@@ -38,9 +39,10 @@ def main():
     if not tests_dir.exists() or not tests_dir.is_dir():
         print(f"Error: {str(tests_dir)} does not exist.")
         sys.exit(1)
-    killed_mutants_dir = work_dir / "killed_mutants"
-    if not killed_mutants_dir.exists() or not killed_mutants_dir.is_dir():
-        print(f"Error: {str(killed_mutants_dir)} does not exist.")
+    kill_database_file = work_dir / KILL_DATABASE_FILENAME
+    if not kill_database_file.exists():
+        print(f"Error: {str(kill_database_file)} does not exist. Results in the format used by earlier versions of the "
+              f"runners can be imported using import-kill-database.")
         sys.exit(1)
 
     killed_mutant_to_test_info: Dict[int, Dict] = {}
@@ -49,24 +51,16 @@ def main():
     # actionable. The reason for determining all such tests upfront is that when we reduce one
     # such test, we can quickly see whether it kills any of the mutants killed by the other
     # tests, avoiding the need to reduce those tests too if so.
-    for test in tests_dir.glob('*'):
-        if not test.is_dir():
-            continue
-        if not test.name.startswith("csmith"):
-            continue
-        kill_summary: Path = test / "kill_summary.json"
-        if not kill_summary.exists():
-            continue
-        kill_summary_json: Dict = json.load(open(kill_summary, 'r'))
-        for mutant in kill_summary_json["killed_mutants"]:
-            mutant_summary = json.load(open(killed_mutants_dir / str(mutant) / "kill_info.json", 'r'))
-            kill_type: str = mutant_summary['kill_type']
-            if (kill_type == 'KillStatus.KILL_DIFFERENT_STDOUT'
-                    or kill_type == 'KillStatus.KILL_RUNTIME_TIMEOUT'
-                    or kill_type == 'KillStatus.KILL_DIFFERENT_EXIT_CODES'):
-                # This is an actionable kill: the mutated compiler produces a compilable program
-                # that runs, but that deviates from the expected result at runtime.
-                killed_mutant_to_test_info[mutant] = mutant_summary
+    with open_kill_database(work_dir) as kill_database:
+        kills = kill_database.get_kills_by_tests(test_name_prefix="csmith")
+    for _, mutant, mutant_summary in kills:
+        kill_type: str = mutant_summary['kill_type']
+        if (kill_type == 'KillStatus.KILL_DIFFERENT_STDOUT'
+                or kill_type == 'KillStatus.KILL_RUNTIME_TIMEOUT'
+                or kill_type == 'KillStatus.KILL_DIFFERENT_EXIT_CODES'):
+            # This is an actionable kill: the mutated compiler produces a compilable program
+            # that runs, but that deviates from the expected result at runtime.
+            killed_mutant_to_test_info[mutant] = mutant_summary
     
     reduction_queue: List[int] = list(killed_mutant_to_test_info.keys())
     reduction_queue.sort()
@@ -85,6 +79,7 @@ def main():
 
         print(f"Preparing to reduce mutant {mutant_to_reduce}. Details: {killed_mutant_to_test_info[mutant_to_reduce]}")
 
+        killing_test_dir: Path = tests_dir / killed_mutant_to_test_info[mutant_to_reduce]['killing_test']
         interestingness_test_template = jinja2.Environment(
             loader=jinja2.FileSystemLoader(
                 searchpath=os.path.dirname(os.path.realpath(__file__)))).get_template("interesting.py.template")
@@ -92,6 +87,7 @@ def main():
             program_to_check="prog.c",
             mutated_compiler_executable=args.mutated_compiler_executable,
             csmith_root=args.csmith_root,
+            compiler_flags=read_test_compiler_flags(killing_test_dir),
             mutation_ids=str(mutant_to_reduce),
             min_timeout_for_mutant_compilation=MIN_TIMEOUT_FOR_MUTANT_COMPILATION,
             timeout_multiplier_for_mutant_compilation=TIMEOUT_MULTIPLIER_FOR_MUTANT_COMPILATION,
@@ -103,7 +99,7 @@ def main():
         # Make the interestingness test executable.
         st = os.stat(current_reduction_dir / 'interesting.py')
         os.chmod(current_reduction_dir / 'interesting.py', st.st_mode | stat.S_IEXEC)
-        shutil.copy(src=tests_dir / killed_mutant_to_test_info[mutant_to_reduce]['killing_test'] / 'prog.c',
+        shutil.copy(src=killing_test_dir / 'prog.c',
                     dst=current_reduction_dir / 'prog.c')
 
         # 12 hour timeout